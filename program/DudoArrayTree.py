@@ -0,0 +1,287 @@
+import copy
+from collections.abc import Mapping
+from itertools import chain
+from typing import List, Tuple
+import numpy as np
+from DudoNode import DudoNode
+from DudoInfoSet import NUM_CODES, ROLL_SHIFT, encode
+
+ROLLS = ['1', '2', '3', '4', '5', '6']
+_template = None
+
+
+class DudoArrayTree(Mapping):
+    '''
+    Struct-of-arrays backend of the 1DD tree.
+    regretSum, strategySum and strategy of every node live in three contiguous arrays.
+    Nodes are grouped by public history (the claims, without the rolled die). The six
+    nodes of a public history are stored next to each other, node index = 6 * public + roll - 1,
+    and their action slots form a (6, NUM_ACTIONS) block starting at slotBase[public].
+    The tree is also a read-only mapping from the legacy str(infoSet) keys to node views,
+    so cfr, cfrPruned and gameValue run on it by assigning it to their nodeMap.
+    >>> tree = DudoArrayTree()
+    >>> len(tree), tree.numPublic
+    (49146, 8191)
+    >>> node = tree["['2', '1*6']"]
+    >>> node.children
+    ['1*1', '2*2', '2*3', '2*4', '2*5', '2*6', '2*1', 'd']
+    >>> node.regretSum[0] = 3.0
+    >>> float(tree.regretSum[tree.offset[tree.index["['2', '1*6']"]]])
+    3.0
+    '''
+    # Public level
+    history: List[List[str]]
+    actions: List[List[str]]
+    numActions: np.ndarray
+    slotBase: np.ndarray
+    actionBase: np.ndarray
+    childPublic: np.ndarray
+    player: np.ndarray
+    # Node level
+    offset: np.ndarray
+    keys: List[str]
+    codes: np.ndarray
+    codeIndex: np.ndarray
+
+    def __init__(self):
+        self.history, self.actions = [], []
+        childLists = []
+        node = DudoNode()
+
+        def buildRecursive(history: List[str]) -> int:
+            public = len(self.history)
+            node.infoSet = ['1'] + history
+            available = node.availableChoices()
+            if len(history) == 0:
+                available.remove('d')
+            self.history.append(history)
+            self.actions.append(available)
+            childLists.append([])
+            for nextAction in available:
+                childLists[public].append(buildRecursive(history + [nextAction]))
+            return public
+
+        buildRecursive([])
+        self.numPublic = len(self.history)
+        self.numActions = np.array([len(a) for a in self.actions], dtype=np.int64)
+        self.actionBase = np.zeros(self.numPublic, dtype=np.int64)
+        self.actionBase[1:] = np.cumsum(self.numActions)[:-1]
+        self.slotBase = 6 * self.actionBase
+        self.childPublic = np.array([c for children in childLists for c in children], dtype=np.int64)
+        self.player = np.array([len(h) % 2 for h in self.history], dtype=np.int64)
+
+        self.numNodes = 6 * self.numPublic
+        self.offset = (np.repeat(self.slotBase, 6)
+                       + np.tile(np.arange(6), self.numPublic) * np.repeat(self.numActions, 6))
+        # The keys and codes of the six nodes of a public history differ in the roll only.
+        self.keys = [key[:2] + roll + key[3:] for key in (str(['1'] + h) for h in self.history) for roll in ROLLS]
+        # DudoInfoSet codes of the nodes, and the node index of every code (-1 if not an information set)
+        historyCodes = np.array([encode(['1'] + h) for h in self.history], dtype=np.int64)
+        self.codes = (historyCodes[:, None] | (np.arange(6) << ROLL_SHIFT)).ravel()
+        self.codeIndex = np.full(NUM_CODES, -1, dtype=np.int64)
+        self.codeIndex[self.codes] = np.arange(self.numNodes)
+        NUM_SLOTS = 6 * int(self.numActions.sum())
+        self.regretSum = np.zeros(NUM_SLOTS)
+        self.strategySum = np.zeros(NUM_SLOTS)
+        self.strategy = np.zeros(NUM_SLOTS)
+        self._index = None
+        self._views = [None] * self.numNodes
+
+    @classmethod
+    def cached(cls) -> 'DudoArrayTree':
+        '''
+        Returns an empty tree that shares the read-only layout of a tree built once per process.
+        '''
+        global _template
+        if _template is None:
+            _template = cls()
+        tree = copy.copy(_template)
+        tree.regretSum = np.zeros_like(_template.regretSum)
+        tree.strategySum = np.zeros_like(_template.strategySum)
+        tree.strategy = np.zeros_like(_template.strategy)
+        tree._views = [None] * tree.numNodes
+        return tree
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_index'] = None
+        state['_views'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._views = [None] * self.numNodes
+
+    @property
+    def index(self) -> dict:
+        '''
+        Maps legacy str(infoSet) keys to node indices, built on first use.
+        '''
+        if self._index is None:
+            self._index = {key: i for i, key in enumerate(self.keys)}
+        return self._index
+
+    def __getitem__(self, key: str) -> 'ArrayNode':
+        return self.node(self.index[key])
+
+    def __iter__(self):
+        return iter(self.keys)
+
+    def __len__(self):
+        return self.numNodes
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def nodeByCode(self, code: int) -> 'ArrayNode':
+        return self.node(self.codeIndex[code])
+
+    def node(self, i: int) -> 'ArrayNode':
+        view = self._views[i]
+        if view is None:
+            view = self._views[i] = ArrayNode(self, i)
+        return view
+
+    def block(self, array: np.ndarray, public: int) -> np.ndarray:
+        '''
+        Returns the (6, NUM_ACTIONS) view of array for a public history, one row per roll.
+        '''
+        start = self.slotBase[public]
+        NUM_ACTIONS = self.numActions[public]
+        return array[start: start + 6 * NUM_ACTIONS].reshape(6, NUM_ACTIONS)
+
+    def children(self, public: int) -> np.ndarray:
+        '''
+        Returns the public indices of the histories following each action.
+        '''
+        start = self.actionBase[public]
+        return self.childPublic[start: start + self.numActions[public]]
+
+    def averageStrategy(self, strategySum: np.ndarray = None) -> np.ndarray:
+        '''
+        DudoNode.getAverageStrategy of every node at once, as a flat array in the slot layout:
+        normalize strategySum, drop actions below 0.01 and normalize again.
+        '''
+        if strategySum is None:
+            strategySum = self.strategySum
+        decision = self.offset[np.repeat(self.numActions, 6) > 0]
+        NUM_ACTIONS = np.repeat(self.numActions[self.numActions > 0], 6)
+        normalizingSum = np.repeat(np.add.reduceat(strategySum, decision), NUM_ACTIONS)
+        avgStrategy = np.divide(strategySum, normalizingSum, out=np.repeat(1 / NUM_ACTIONS, NUM_ACTIONS),
+                                where=normalizingSum > 0)
+        avgStrategy[avgStrategy < 0.01] = 0
+        avgStrategy /= np.repeat(np.add.reduceat(avgStrategy, decision), NUM_ACTIONS)
+        return avgStrategy
+
+    def gatherFromNodeMap(self, nodeMap: dict) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        '''
+        Returns regretSum, strategySum and strategy of a dict of DudoNode as flat arrays in the layout of the tree.
+        Nodes in index order have consecutive slots, so the arrays are the node lists chained together.
+        '''
+        nodes = [nodeMap[key] for key in self.keys]
+        NUM_SLOTS = len(self.regretSum)
+        return tuple(np.fromiter(chain.from_iterable(getattr(node, name) for node in nodes), dtype=np.float64, count=NUM_SLOTS)
+                     for name in ('regretSum', 'strategySum', 'strategy'))
+
+    def copyFromNodeMap(self, nodeMap: dict):
+        '''
+        Copies regretSum, strategySum and strategy (and promising_branches, if set) out of a dict of DudoNode.
+        '''
+        self.regretSum[:], self.strategySum[:], self.strategy[:] = self.gatherFromNodeMap(nodeMap)
+        for i, key in enumerate(self.keys):
+            node = nodeMap[key]
+            if hasattr(node, 'promising_branches'):
+                self.node(i).promising_branches = list(node.promising_branches)
+
+    def copyToNodeMap(self, nodeMap: dict):
+        '''
+        Writes regretSum, strategySum and strategy into an existing dict of DudoNode.
+        '''
+        regretSum, strategySum, strategy = self.regretSum.tolist(), self.strategySum.tolist(), self.strategy.tolist()
+        for key, start in zip(self.keys, self.offset.tolist()):
+            node = nodeMap[key]
+            end = start + len(node.regretSum)
+            node.regretSum[:] = regretSum[start: end]
+            node.strategySum[:] = strategySum[start: end]
+            node.strategy[:] = strategy[start: end]
+
+    def promisingBranches(self) -> dict:
+        '''
+        Returns promising_branches of the nodes that have them (see DudoUtil.prune), by key.
+        '''
+        return {self.keys[i]: view.promising_branches for i, view in enumerate(self._views)
+                if view is not None and hasattr(view, 'promising_branches')}
+
+    def nodesWith(self, attribute: str) -> dict:
+        '''
+        Returns the nodes that have attribute set (e.g. pruneGain of trainerPruned.cfrDynamic), by key.
+        '''
+        return {self.keys[i]: view for i, view in enumerate(self._views) if view is not None and hasattr(view, attribute)}
+
+    @classmethod
+    def fromNodeMap(cls, nodeMap: dict) -> 'DudoArrayTree':
+        tree = cls.cached()
+        tree.copyFromNodeMap(nodeMap)
+        return tree
+
+    def toNodeMap(self) -> dict:
+        '''
+        Returns the tree as the legacy dict of DudoNode, e.g. for pickling.
+        '''
+        nodeMap = dict()
+        regretSum, strategySum, strategy = self.regretSum.tolist(), self.strategySum.tolist(), self.strategy.tolist()
+        for i, key in enumerate(self.keys):
+            public, roll = divmod(i, 6)
+            node = DudoNode()
+            node.infoSet = [ROLLS[roll]] + self.history[public]
+            node.children = self.actions[public]
+            start = self.offset[i]
+            end = start + self.numActions[public]
+            node.regretSum, node.strategySum, node.strategy = regretSum[start: end], strategySum[start: end], strategy[start: end]
+            view = self._views[i]
+            if view is not None and hasattr(view, 'promising_branches'):
+                node.promising_branches = list(view.promising_branches)
+            nodeMap[key] = node
+        return nodeMap
+
+
+def _slotProperty(name: str):
+    # Assigning a list to a view (e.g. resetSS) writes into the tree instead of rebinding.
+    attr = '_' + name
+
+    def getter(self):
+        return getattr(self, attr)
+
+    def setter(self, value):
+        getattr(self, attr)[:] = value
+    return property(getter, setter)
+
+
+class ArrayNode(DudoNode):
+    '''
+    DudoNode whose regretSum, strategySum and strategy are views into a DudoArrayTree.
+    '''
+    regretSum = _slotProperty('regretSum')
+    strategySum = _slotProperty('strategySum')
+    strategy = _slotProperty('strategy')
+
+    def __init__(self, tree: DudoArrayTree, index: int):
+        super().__init__()
+        public, roll = divmod(index, 6)
+        self.infoSet = [ROLLS[roll]] + tree.history[public]
+        self.children = tree.actions[public]
+        start = tree.offset[index]
+        end = start + tree.numActions[public]
+        self._regretSum = tree.regretSum[start: end]
+        self._strategySum = tree.strategySum[start: end]
+        self._strategy = tree.strategy[start: end]
+
+    def getStrategy(self, realizationWeight: float) -> np.ndarray:
+        np.maximum(self._regretSum, 0, out=self._strategy)
+        normalizingSum = self._strategy.sum()
+        if normalizingSum > 0:
+            self._strategy /= normalizingSum
+        else:
+            self._strategy[:] = 1 / len(self._strategy)
+        self._strategySum += realizationWeight * self._strategy
+        return self._strategy
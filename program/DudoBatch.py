@@ -0,0 +1,91 @@
+'''
+Batched chance sampling: one walk of the public tree for many sampled dice pairs, the sum of their cfr
+updates taken at the strategy the batch starts with.
+'''
+from typing import List
+import numpy as np
+from DudoInfoSet import CHILDREN, PLAYER, ROLL_SHIFT, terminalPayoff
+from DudoUpdateRule import UpdateRule
+
+
+class BatchCfr():
+    '''
+    nodes is indexed by DudoInfoSet code, see DudoInfoSet.nodeList.
+    >>> from DudoUtil import createEmptyTree
+    >>> from DudoInfoSet import nodeList
+    >>> nodeMap = createEmptyTree()
+    >>> engine = BatchCfr(nodeList(nodeMap))
+    >>> round(engine.run([[2, 5], [2, 5], [6, 1]]), 6)
+    -0.097222
+    >>> nodeMap["['2']"].times_visited, nodeMap["['5']"].times_visited
+    (2, 0)
+    '''
+
+    def __init__(self, nodes: list, rule: UpdateRule = None):
+        self.nodes = nodes
+        self.rule = UpdateRule() if rule is None else rule
+
+    def run(self, dice: List[List[int]], pruned: bool = False) -> float:
+        '''
+        One update for all dice pairs, returns the summed utility of player 0.
+        pruned restricts every information set to its promising_branches (if set), as cfrPruned does.
+        '''
+        counts = np.zeros((6, 6))
+        for d0, d1 in dice:
+            counts[d0 - 1, d1 - 1] += 1
+        outcomes = np.argwhere(counts)
+        self.counts = counts[outcomes[:, 0], outcomes[:, 1]]
+        self.rolls = (outcomes[:, 0], outcomes[:, 1])
+        self.dice = (outcomes[:, 0] + 1, outcomes[:, 1] + 1)
+        # For each player: (roll - 1, the outcomes with that roll).
+        self.groups = [[(r, np.flatnonzero(rolls == r)) for r in np.unique(rolls)] for rolls in self.rolls]
+        self.pruned = pruned
+        ones = np.ones(len(self.counts))
+        return float(self.counts @ self._walk(0, ones, ones))
+
+    def _walk(self, history: int, reach0: np.ndarray, reach1: np.ndarray) -> np.ndarray:
+        # Returns the utilities of the player to act, one per outcome.
+        if history & 1:
+            return terminalPayoff(history, *self.dice)
+        if not reach0.any() and not reach1.any():
+            # Nothing below this history can be updated, and it contributes nothing above.
+            return np.zeros(len(self.counts))
+
+        curr_player = PLAYER[history]
+        ownReach, otherReach = (reach0, reach1) if curr_player == 0 else (reach1, reach0)
+        children = CHILDREN[history]
+        NUM_ACTIONS = len(children)
+        strategy = np.empty((len(self.counts), NUM_ACTIONS))
+        mask = np.ones((len(self.counts), NUM_ACTIONS))
+        visits = []
+        for roll, outcomes in self.groups[curr_player]:
+            curr_node = self.nodes[int(roll) << ROLL_SHIFT | history]
+            weight = self.counts[outcomes] * otherReach[outcomes]
+            samples = int(self.counts[outcomes].sum())
+            curr_node.times_visited += samples
+            if not self.pruned:
+                curr_node.count_realization += samples
+                curr_node.realization_sum += weight.sum()
+            strategy[outcomes] = self.rule.getStrategy(curr_node, self.counts[outcomes] @ ownReach[outcomes])
+            actions = getattr(curr_node, 'promising_branches', range(NUM_ACTIONS)) if self.pruned else range(NUM_ACTIONS)
+            if self.pruned:
+                mask[outcomes] = 0
+                mask[np.ix_(outcomes, actions)] = 1
+            visits.append((curr_node, outcomes, weight, actions))
+
+        util = np.empty((NUM_ACTIONS, len(self.counts)))
+        for a in range(NUM_ACTIONS):
+            if curr_player == 0:
+                util[a] = -self._walk(children[a], reach0 * strategy[:, a] * mask[:, a], reach1 * mask[:, a])
+            else:
+                util[a] = -self._walk(children[a], reach0 * mask[:, a], reach1 * strategy[:, a] * mask[:, a])
+        nodeUtil = np.einsum('na,an->n', strategy * mask, util)
+
+        for curr_node, outcomes, weight, actions in visits:
+            total = weight.sum()
+            if total > 0:
+                self.rule.accumulateRegret(curr_node, (util[:, outcomes] @ weight / total).tolist(),
+                                           float(nodeUtil[outcomes] @ weight / total), total, actions)
+            else:
+                self.rule.accumulateRegret(curr_node, [0.] * NUM_ACTIONS, 0., 0., actions)
+        return nodeUtil
@@ -0,0 +1,186 @@
+'''
+Repeatable performance measurements of the trainers and utilities.
+Every benchmark seeds the random module, so the same work is timed on every run. Results are
+written as JSON ({name: {value, unit, higherIsBetter}} plus the machine they were taken on)
+and compared against a stored baseline: a benchmark regresses when it is worse than the
+baseline by more than the threshold (relative). Baselines are machine specific, record one
+per machine with --update-baseline before trying a speedup. processPeakMemory is the peak of the
+whole process, so it is only comparable between runs of the same benchmarks (--only).
+
+python DudoBenchmark.py [--quick] [--output benchmarks/latest.json] [--baseline benchmarks/baseline.json]
+                        [--threshold 0.2] [--update-baseline] [--only name,name]
+Exits with status 1 if a benchmark regressed.
+'''
+import argparse
+import json
+import os
+import pickle
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Dict, List
+import DudoTrainer
+import trainerPruned
+import trainerPrunedPar
+from DudoArrayTree import DudoArrayTree
+from DudoEvaluator import GameValueEvaluator
+from DudoInfoSet import nodeList
+from DudoIterative import IterativeCfr
+from DudoTelemetry import peakMemory
+from DudoUtil import createEmptyTree, gameValue, prune, readNodeMap
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baseline.json')
+# Results of the last run, not tracked.
+OUTPUT_PATH = os.path.join(os.path.dirname(BASELINE_PATH), 'latest.json')
+
+# Work per benchmark at scale 1, --quick runs a tenth of it.
+SIZES = dict(cfr=300, iterative=600, dynamic=3000, warmup=2000, pruned=1000, parallel=4000, workers=2)
+
+
+def _result(value: float, unit: str, higherIsBetter: bool) -> dict:
+    return dict(value=value, unit=unit, higherIsBetter=higherIsBetter)
+
+
+def _best(f, repeat: int = 3) -> float:
+    # Shortest of a few runs, in seconds.
+    times = []
+    for _ in range(repeat):
+        t1 = time.perf_counter()
+        f()
+        times.append(time.perf_counter() - t1)
+    return min(times)
+
+
+def _rate(iterations: int, run, seed: int) -> float:
+    # Iterations per second of run(rolledDice), on dice drawn from seed.
+    random.seed(seed)
+    dice = [[random.randint(1, 6), random.randint(1, 6)] for _ in range(iterations)]
+    t1 = time.perf_counter()
+    for rolledDice in dice:
+        run(rolledDice)
+    return iterations / (time.perf_counter() - t1)
+
+
+def benchTree(sizes: dict, seed: int) -> Dict[str, dict]:
+    results = dict(createEmptyTree=_result(_best(createEmptyTree), 's', False))
+    tracemalloc.start()
+    createEmptyTree()
+    results['treeMemory'] = _result(tracemalloc.get_traced_memory()[1] / 2 ** 20, 'MiB', False)
+    tracemalloc.stop()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'nodeMap')
+        with open(path, 'wb') as f:
+            pickle.dump(createEmptyTree(), f)
+        results['readNodeMap'] = _result(_best(lambda: readNodeMap(path)), 's', False)
+    return results
+
+
+def benchCfr(sizes: dict, seed: int) -> Dict[str, dict]:
+    DudoTrainer.nodeMap = createEmptyTree()
+    rate = _rate(sizes['cfr'], lambda d: DudoTrainer.cfr(d, [str(d[0])], 1, 1), seed)
+    engine = IterativeCfr(nodeList(createEmptyTree()))
+    return dict(cfr=_result(rate, 'it/s', True),
+                cfrIterative=_result(_rate(sizes['iterative'], engine.run, seed), 'it/s', True))
+
+
+def benchPruned(sizes: dict, seed: int) -> Dict[str, dict]:
+    '''
+    cfrDynamic from an empty tree, then cfrPruned and trainerPrunedPar on that tree, pruned at threshold -1.
+    '''
+    trainerPruned.nodeMap = createEmptyTree()
+    rate = _rate(sizes['dynamic'], lambda d: trainerPruned.cfrDynamic(d, [str(d[0])], 1, 1), seed)
+    results = dict(cfrDynamic=_result(rate, 'it/s', True))
+
+    nodeMap = createEmptyTree()
+    trainerPruned.nodeMap = nodeMap
+    _rate(sizes['warmup'], lambda d: trainerPruned.cfrDynamic(d, [str(d[0])], 1, 1), seed)
+    prune(nodeMap, -1)
+    tree = DudoArrayTree.fromNodeMap(nodeMap)
+    rate = _rate(sizes['pruned'], lambda d: trainerPruned.cfrPruned(d, [str(d[0])], 1, 1), seed)
+    results['cfrPruned'] = _result(rate, 'it/s', True)
+
+    trainerPrunedPar.tree = tree
+    t1 = time.perf_counter()
+    trainerPrunedPar.train(sizes['parallel'], sizes['workers'], seed=seed)
+    results['cfrPrunedPar'] = _result(sizes['parallel'] / (time.perf_counter() - t1), 'it/s', True)
+    return results
+
+
+def benchGameValue(sizes: dict, seed: int) -> Dict[str, dict]:
+    nodeMap = createEmptyTree()
+    evaluator = GameValueEvaluator(nodeMap)
+    evaluator.gameValue()
+    return dict(gameValue=_result(_best(lambda: gameValue(nodeMap), 1), 's', False),
+                evaluatorGameValue=_result(_best(evaluator.gameValue), 's', False))
+
+
+BENCHMARKS = dict(tree=benchTree, cfr=benchCfr, pruned=benchPruned, gameValue=benchGameValue)
+
+
+def run(scale: float = 1., seed: int = 0, only: List[str] = None) -> dict:
+    sizes = {name: max(1, int(size * scale)) for name, size in SIZES.items()}
+    sizes['workers'] = SIZES['workers']
+    results = {}
+    for name, benchmark in BENCHMARKS.items():
+        if only is None or name in only:
+            results.update(benchmark(sizes, seed))
+    memory = peakMemory()
+    if memory is not None:
+        results['processPeakMemory'] = _result(memory, 'MiB', False)
+    return dict(machine=platform.node(), python=platform.python_version(), scale=scale, seed=seed,
+                time=time.strftime('%Y-%m-%d %H:%M:%S'), results=results)
+
+
+def compare(report: dict, baseline: dict, threshold: float = .2) -> List[str]:
+    '''
+    Returns a line for each benchmark that is worse than in baseline by more than threshold.
+    >>> old = dict(results=dict(cfr=_result(20., 'it/s', True), gameValue=_result(1., 's', False)))
+    >>> new = dict(results=dict(cfr=_result(15., 'it/s', True), gameValue=_result(1.05, 's', False)))
+    >>> compare(new, old)
+    ['cfr: 15 it/s against 20 it/s in the baseline (-25.0%)']
+    '''
+    regressions = []
+    for name, result in report['results'].items():
+        if name not in baseline['results']:
+            continue
+        old, new = baseline['results'][name]['value'], result['value']
+        change = (new - old) / old if old else 0.
+        worse = -change if result['higherIsBetter'] else change
+        if worse > threshold:
+            regressions.append(f"{name}: {new:.4g} {result['unit']} against {old:.4g} {result['unit']} "
+                               f"in the baseline ({change:+.1%})")
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks of the Dudo trainers.')
+    parser.add_argument('--quick', action='store_true', help='a tenth of the work, for smoke tests')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--threshold', type=float, default=.2)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--only', help='comma separated groups of ' + ', '.join(BENCHMARKS))
+    args = parser.parse_args()
+
+    report = run(.1 if args.quick else 1., args.seed, args.only.split(',') if args.only else None)
+    for name, result in report['results'].items():
+        print(f"{name}: {result['value']:.4g} {result['unit']}")
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['scale'] != report['scale']:
+            print(f"Baseline was taken at scale {baseline['scale']}, rates are not comparable.")
+        regressions = compare(report, baseline, args.threshold)
+        for line in regressions:
+            print("Regression " + line)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,72 @@
+'''
+Best response and exploitability of the average strategy.
+The opponent's reach probability of every public history is computed in a forward pass over
+the levels of DudoEvaluator.TreeLevels, then a backward pass gives the best responder the
+action of highest counterfactual value at each of its information sets, for all rolls at once.
+exploitability = (bestResponse(0) + bestResponse(1)) / 2, which is 0 exactly at a Nash equilibrium.
+'''
+import sys
+from typing import Tuple
+import numpy as np
+from DudoEvaluator import GameValueEvaluator, TreeLevels
+from DudoPolicy import loadTree
+
+
+def opponentReach(levels: TreeLevels, avgStrategy: np.ndarray, player: int) -> np.ndarray:
+    '''
+    Returns the (numPublic, 6) probabilities that the opponent of player plays to each public history, by its roll.
+    '''
+    reach = np.ones((levels.numPublic, 6))
+    for actor, publics, rows, children, starts in reversed(levels.levels):
+        parentReach = np.repeat(reach[publics], np.diff(np.append(starts, len(rows))), axis=0)
+        reach[children] = parentReach * avgStrategy[rows] if actor != player else parentReach
+    return reach
+
+
+def bestResponse(levels: TreeLevels, avgStrategy: np.ndarray, player: int) -> float:
+    '''
+    Expected payoff of player when best responding to avgStrategy of the other player.
+    '''
+    reach = opponentReach(levels, avgStrategy, player)
+    # value[p][d0][d1]: payoff of player below p, weighted by the opponent's reach.
+    value = np.empty((levels.numPublic, 6, 6))
+    sign = levels.terminalSign(player)
+    if player == 0:
+        value[levels.terminalPublic] = sign[:, None, None] * levels.terminalValue * reach[levels.terminalPublic][:, None, :]
+    else:
+        value[levels.terminalPublic] = sign[:, None, None] * levels.terminalValue * reach[levels.terminalPublic][:, :, None]
+    for actor, publics, rows, children, starts in levels.levels:
+        childValue = value[children]
+        if actor != player:
+            value[publics] = np.add.reduceat(childValue, starts, axis=0)
+            continue
+        # Counterfactual value of every action for each roll of player, and the first best action per segment.
+        actionValue = childValue.sum(axis=2 if player == 0 else 1)
+        NUM_ACTIONS = np.diff(np.append(starts, len(rows)))
+        best = actionValue >= np.repeat(np.maximum.reduceat(actionValue, starts, axis=0), NUM_ACTIONS, axis=0)
+        count = np.cumsum(best, axis=0)
+        before = np.vstack([np.zeros((1, 6), dtype=count.dtype), count[starts[1:] - 1]])
+        best &= (count - np.repeat(before, NUM_ACTIONS, axis=0)) == 1
+        selected = best[:, :, None] if player == 0 else best[:, None, :]
+        value[publics] = np.add.reduceat(childValue * selected, starts, axis=0)
+    return float(value[0].mean())
+
+
+def exploitability(evaluator: GameValueEvaluator) -> Tuple[float, float, float]:
+    '''
+    Returns (exploitability, best response value of player 0, best response value of player 1)
+    of the average strategy of the evaluator's nodes.
+    '''
+    avgStrategy = evaluator.layout.averageStrategy(evaluator.refresh())
+    br0 = bestResponse(evaluator.levels, avgStrategy, 0)
+    br1 = bestResponse(evaluator.levels, avgStrategy, 1)
+    return (br0 + br1) / 2, br0, br1
+
+
+if __name__ == '__main__':
+    # python DudoBestResponse.py <checkpoint or pickled nodeMap>
+    evaluator = GameValueEvaluator(loadTree(sys.argv[1]))
+    value, br0, br1 = exploitability(evaluator)
+    print("Theoretical game value: " + str(evaluator.gameValue()))
+    print(f"Best response value of player 0: {br0}, of player 1: {br1}")
+    print("Exploitability: " + str(value))
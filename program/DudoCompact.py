@@ -0,0 +1,87 @@
+'''
+Compaction of a pruned tree: CompactTree copies the nodes that cfrPruned reaches through promising_branches,
+in traversal order and with child ids by roll of the other player, for trainerPruned.cfrCompact.
+scatter and gather copy their state to and from the full nodeMap. Terminal nodes are not copied.
+'''
+from typing import List
+from DudoNode import DudoNode
+from DudoPayoff import claimStrength
+
+
+def _copyState(source: DudoNode, target: DudoNode):
+    # Lists are copied in place, so other holders of the target's lists (e.g. IterativeCfr) stay valid.
+    state = target.__dict__
+    for name, value in source.__dict__.items():
+        current = state.get(name)
+        if isinstance(value, list) and isinstance(current, list) and len(current) == len(value):
+            current[:] = value
+        else:
+            state[name] = list(value) if isinstance(value, list) else value
+
+
+class CompactTree():
+    '''
+    >>> from DudoUtil import createEmptyTree, prune
+    >>> nodeMap = createEmptyTree()
+    >>> for node in nodeMap.values():
+    ...     node.promising_branches = [len(node.children) - 1] if node.children else []
+    >>> tree = CompactTree(nodeMap)
+    >>> len(tree), tree.keys[:2], tree.next[0]
+    (12, ["['1']", "['1', '2*1']"], [(11, (1, 2, 3, 4, 5, 6))])
+    '''
+
+    def __init__(self, nodeMap: dict):
+        self.keys: List[str] = []
+        self.nodes: List[DudoNode] = []
+        self.player: List[int] = []
+        # next[i]: (action, child ids by roll of the other player, or the strength of the claim called dudo)
+        self.next: List[list] = []
+        # Promising actions, and scratch utilities of cfrCompact (a node is at most once on the stack).
+        self.actions: List[list] = []
+        self.util: List[list] = []
+        ids = {}
+
+        def visit(infoSet: List[str]) -> int:
+            key = str(infoSet)
+            i = ids[key] = len(self.keys)
+            node = nodeMap[key]
+            copy = DudoNode.__new__(DudoNode)
+            _copyState(node, copy)
+            self.keys.append(key)
+            self.nodes.append(copy)
+            self.player.append((len(infoSet) - 1) % 2)
+            self.util.append([0] * len(node.children))
+            self.next.append([])
+            branches = list(getattr(node, 'promising_branches', range(len(node.children))))
+            self.actions.append(branches)
+            for a in branches:
+                action = node.children[a]
+                if action == 'd':
+                    self.next[i].append((a, claimStrength(infoSet[-1])))
+                    continue
+                children = []
+                for roll in range(1, 7):
+                    child = [str(roll)] + infoSet[1:] + [action]
+                    childKey = str(child)
+                    children.append(ids[childKey] if childKey in ids else visit(child))
+                self.next[i].append((a, tuple(children)))
+            return i
+
+        self.roots = [visit([str(roll)]) for roll in range(1, 7)]
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def scatter(self, nodeMap: dict):
+        '''
+        Writes the state of the compact nodes into the nodes of nodeMap.
+        '''
+        for key, node in zip(self.keys, self.nodes):
+            _copyState(node, nodeMap[key])
+
+    def gather(self, nodeMap: dict):
+        '''
+        Reads the state of the nodes of nodeMap into the compact nodes again.
+        '''
+        for key, node in zip(self.keys, self.nodes):
+            _copyState(nodeMap[key], node)
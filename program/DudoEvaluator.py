@@ -0,0 +1,201 @@
+'''
+Fast evaluation of the theoretical game value (DudoUtil.gameValue).
+The value of all 36 dice outcomes is computed in one backward pass over the public tree,
+one depth at a time, on the flat average strategies of DudoArrayTree.averageStrategy.
+For a dict of DudoNode the strategy sums are cached: every traversal increments
+times_visited of the nodes it touches, so only nodes whose counter moved since the
+last evaluation are read again.
+'''
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import List
+import numpy as np
+from DudoArrayTree import DudoArrayTree
+from DudoPayoff import PAYOFF_TABLE, claimStrength
+from DudoRules import ONE_DIE
+
+
+class TreeLevels():
+    '''
+    Index arrays for the backward pass over the public tree of a DudoArrayTree layout.
+    '''
+
+    def __init__(self, tree: DudoArrayTree):
+        depth = np.array([len(h) for h in tree.history])
+        self.terminal = np.array([bool(h) and h[-1] == 'd' for h in tree.history])
+        self.terminalPublic = np.flatnonzero(self.terminal)
+        # Terminal values are payoffs of the claimant, the player to act after the dudo.
+        self.terminalPlayer = depth[self.terminalPublic] % 2
+        self.terminalValue = np.stack([PAYOFF_TABLE[claimStrength(tree.history[p][-2])] for p in self.terminalPublic]).astype(np.float64)
+        # One entry per depth with decisions, deepest first: (player, publics, action slot rows, children, segment starts)
+        self.levels = []
+        for level in range(depth.max(), -1, -1):
+            publics = np.flatnonzero((depth == level) & ~self.terminal)
+            if len(publics) == 0:
+                continue
+            NUM_ACTIONS = tree.numActions[publics]
+            # For every (public, action): the six slots of that action, one per roll of the player to act.
+            actionOfSlot = np.arange(NUM_ACTIONS.sum()) - np.repeat(np.cumsum(NUM_ACTIONS) - NUM_ACTIONS, NUM_ACTIONS)
+            rows = (np.repeat(tree.slotBase[publics], NUM_ACTIONS) + actionOfSlot)[:, None] \
+                + np.arange(6)[None, :] * np.repeat(NUM_ACTIONS, NUM_ACTIONS)[:, None]
+            children = tree.childPublic[np.repeat(tree.actionBase[publics], NUM_ACTIONS) + actionOfSlot]
+            starts = np.cumsum(NUM_ACTIONS) - NUM_ACTIONS
+            self.levels.append((level % 2, publics, rows, children, starts))
+        self.numPublic = tree.numPublic
+
+    def terminalSign(self, player: int) -> np.ndarray:
+        '''
+        1 for terminal histories whose values are payoffs of player, -1 for those of the other player.
+        '''
+        return np.where(self.terminalPlayer == player, 1., -1.)
+
+    def values(self, avgStrategy: np.ndarray) -> np.ndarray:
+        '''
+        Returns the (numPublic, 6, 6) values of every public history for the player to act,
+        indexed by (die of player 0, die of player 1), when both play avgStrategy.
+        '''
+        value = np.empty((self.numPublic, 6, 6))
+        value[self.terminalPublic] = self.terminalValue
+        for player, publics, rows, children, starts in self.levels:
+            strategy = avgStrategy[rows]
+            if player == 0:
+                contribution = strategy[:, :, None] * value[children]
+            else:
+                contribution = strategy[:, None, :] * value[children]
+            value[publics] = -np.add.reduceat(contribution, starts, axis=0)
+        return value
+
+    def gameValue(self, avgStrategy: np.ndarray) -> float:
+        return float(self.values(avgStrategy)[0].mean())
+
+
+class GameValueEvaluator():
+    '''
+    Evaluates the game value of nodes, a dict of DudoNode or a DudoArrayTree, during training.
+    With withExploitability, reports also include the exploitability (see DudoBestResponse).
+    >>> from DudoUtil import createEmptyTree, gameValue
+    >>> nodeMap = createEmptyTree()
+    >>> abs(GameValueEvaluator(nodeMap).gameValue() - gameValue(nodeMap)) < 1e-12
+    True
+    '''
+
+    def __init__(self, nodes, withExploitability: bool = False):
+        self.nodes = nodes
+        self.withExploitability = withExploitability
+        if isinstance(nodes, DudoArrayTree):
+            self.layout = nodes
+        else:
+            self.layout = DudoArrayTree.cached()
+            self.nodeList = [nodes[key] for key in self.layout.keys]
+            self.strategySum = np.zeros(len(self.layout.strategySum))
+            self.visitedAt = [-1] * len(self.nodeList)
+        self.levels = TreeLevels(self.layout)
+        self._executor = None
+        self._pending = []
+        # Values of the latest report, as {gameValueIteration, gameValue, exploitability}.
+        self.latest = None
+
+    def refresh(self) -> np.ndarray:
+        '''
+        Returns the current strategy sums in the slot layout, reading only nodes visited since the last call.
+        '''
+        if isinstance(self.nodes, DudoArrayTree):
+            return self.nodes.strategySum
+        offset = self.layout.offset
+        strategySum, visitedAt = self.strategySum, self.visitedAt
+        for i, node in enumerate(self.nodeList):
+            if node.times_visited != visitedAt[i]:
+                visitedAt[i] = node.times_visited
+                start = offset[i]
+                strategySum[start: start + len(node.strategySum)] = node.strategySum
+        return strategySum
+
+    def gameValue(self) -> float:
+        return self.levels.gameValue(self.layout.averageStrategy(self.refresh()))
+
+    def submit(self) -> Future:
+        '''
+        Evaluates a snapshot of the current strategy sums in a background process.
+        Returns a Future of (game value, exploitability or None), so training can continue meanwhile.
+        '''
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1)
+        return self._executor.submit(_snapshotValue, self.refresh().copy(), self.withExploitability)
+
+    def report(self, iteration: int, background: bool = False) -> List[str]:
+        '''
+        Progress lines of the trainers. In the background, a snapshot is submitted and the
+        values of earlier snapshots that are done by now are reported with their iteration.
+        '''
+        if not background:
+            value = self.gameValue()
+            self.latest = dict(gameValueIteration=iteration, gameValue=value)
+            lines = ["Theoretical game value: " + str(value)]
+            if self.withExploitability:
+                from DudoBestResponse import exploitability
+                self.latest['exploitability'] = exploitability(self)[0]
+                lines.append("Exploitability: " + str(self.latest['exploitability']))
+            return lines
+        lines = self.collect()
+        self._pending.append((iteration, self.submit()))
+        return lines
+
+    def collect(self, wait: bool = False) -> List[str]:
+        lines = []
+        while self._pending and (wait or self._pending[0][1].done()):
+            iteration, future = self._pending.pop(0)
+            value, exploitability = future.result()
+            self.latest = dict(gameValueIteration=iteration, gameValue=value)
+            if exploitability is not None:
+                self.latest['exploitability'] = exploitability
+            lines.append(f"Theoretical game value at {iteration} iterations: " + str(value))
+            if exploitability is not None:
+                lines.append(f"Exploitability at {iteration} iterations: " + str(exploitability))
+        return lines
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class VariantEvaluator():
+    '''
+    Stands in for GameValueEvaluator on the trees of other DudoRules variants, which it can't evaluate:
+    reports are empty.
+    '''
+    latest = None
+
+    def report(self, iteration: int, background: bool = False) -> List[str]:
+        return []
+
+    def collect(self, wait: bool = False) -> List[str]:
+        return []
+
+    def close(self):
+        pass
+
+
+def evaluatorFor(nodes, withExploitability: bool = False):
+    '''
+    GameValueEvaluator of nodes, or a VariantEvaluator if nodes are a LazyNodeMap of another variant than ONE_DIE.
+    '''
+    if getattr(nodes, 'rules', ONE_DIE) != ONE_DIE:
+        return VariantEvaluator()
+    return GameValueEvaluator(nodes, withExploitability)
+
+
+# State of the background evaluation process.
+_levels = None
+
+
+def _snapshotValue(strategySum: np.ndarray, withExploitability: bool) -> tuple:
+    global _levels
+    from DudoBestResponse import bestResponse
+    layout = DudoArrayTree.cached()
+    if _levels is None:
+        _levels = TreeLevels(layout)
+    avgStrategy = layout.averageStrategy(strategySum)
+    exploitability = None
+    if withExploitability:
+        exploitability = (bestResponse(_levels, avgStrategy, 0) + bestResponse(_levels, avgStrategy, 1)) / 2
+    return _levels.gameValue(avgStrategy), exploitability
@@ -0,0 +1,120 @@
+'''
+Integer encoding of 1DD information sets.
+A history is an increasing subset of the 12 claims, optionally followed by dudo, so an
+information set packs into code = (roll - 1) << 13 | claimMask << 1 | dudo, where bit s of
+claimMask is set if the claim of strength s was made. Codes are below NUM_CODES = 6 * 2 ** 13.
+The low 13 bits (code & HISTORY_MASK) are the public history.
+'''
+from typing import List
+import numpy as np
+from DudoPayoff import ALL_CLAIMS, batchPayoff, claimStrength
+
+ROLL_SHIFT = 13
+HISTORY_MASK = (1 << ROLL_SHIFT) - 1
+NUM_HISTORIES = 1 << ROLL_SHIFT
+NUM_CODES = 6 * NUM_HISTORIES
+
+
+def encode(infoSet: List[str]) -> int:
+    '''
+    >>> encode(['3', '1*2', '2*3', 'd'])
+    16643
+    '''
+    code = (int(infoSet[0]) - 1) << ROLL_SHIFT
+    for action in infoSet[1:]:
+        if action == 'd':
+            code |= 1
+        else:
+            code |= 1 << (claimStrength(action) + 1)
+    return code
+
+
+def decode(code: int) -> List[str]:
+    '''
+    >>> decode(16643)
+    ['3', '1*2', '2*3', 'd']
+    '''
+    infoSet = [str((code >> ROLL_SHIFT) + 1)]
+    for s in range(12):
+        if code & (1 << (s + 1)):
+            infoSet.append(ALL_CLAIMS[s])
+    if code & 1:
+        infoSet.append('d')
+    return infoSet
+
+
+def fromKey(key: str) -> int:
+    '''
+    Encodes a legacy str(infoSet) key.
+    >>> fromKey("['3', '1*2', '2*3', 'd']")
+    16643
+    '''
+    return encode([item.strip(" '") for item in key[1:-1].split(',')])
+
+
+def toKey(code: int) -> str:
+    return str(decode(code))
+
+
+def withRoll(history: int, roll: int) -> int:
+    return ((roll - 1) << ROLL_SHIFT) | history
+
+
+def lastClaim(history: int) -> int:
+    '''
+    Strength of the last claim of a history, -1 if no claim was made.
+    '''
+    return ((history & HISTORY_MASK) >> 1).bit_length() - 1
+
+
+def _children(history: int) -> tuple:
+    if history & 1 or history == 1:
+        return ()
+    claims = tuple(history | 1 << (s + 1) for s in range(lastClaim(history) + 1, 12))
+    return claims if history == 0 else claims + (history | 1,)
+
+
+# CHILDREN[history][a] is the history after action a, in the order of DudoNode.availableChoices.
+# PLAYER[history] is the player to act (0 or 1) after the history.
+CHILDREN = [_children(h) for h in range(NUM_HISTORIES)]
+PLAYER = [(bin(h).count('1')) % 2 for h in range(NUM_HISTORIES)]
+# The same as arrays for vectorized code: NUM_ACTIONS_OF[history] is len(CHILDREN[history]),
+# LAST_CLAIM[history] is lastClaim(history).
+NUM_ACTIONS_OF = np.array([len(children) for children in CHILDREN], dtype=np.int64)
+LAST_CLAIM = np.array([lastClaim(h) for h in range(NUM_HISTORIES)], dtype=np.int64)
+
+
+def terminalPayoff(history, dice0, dice1) -> np.ndarray:
+    '''
+    Payoffs of the player to act after dudo histories, who is the claimant, as floats. Arguments as in batchPayoff.
+    >>> history = encode(['3', '1*2', '2*3', 'd']) & HISTORY_MASK
+    >>> PLAYER[history], terminalPayoff(history, np.array([3, 3]), np.array([1, 2])).tolist()
+    (1, [1.0, -1.0])
+    '''
+    return batchPayoff(LAST_CLAIM[history], dice0, dice1).astype(np.float64)
+
+
+def isValid(code: int) -> bool:
+    return 0 <= code < NUM_CODES and code & HISTORY_MASK != 1
+
+
+def nodeList(nodeMap) -> list:
+    '''
+    Returns a list indexed by code of the nodes of nodeMap (None for codes that are not information sets).
+    The nodes are shared, so training through the list updates nodeMap.
+    '''
+    nodes = [None] * NUM_CODES
+    for key in nodeMap:
+        nodes[fromKey(key)] = nodeMap[key]
+    return nodes
+
+
+def toCodeMap(nodeMap: dict) -> dict:
+    return {fromKey(key): nodeMap[key] for key in nodeMap}
+
+
+def toKeyMap(codeMap: dict) -> dict:
+    '''
+    Converts a dict keyed by code back to the legacy str(infoSet) keys, e.g. before pickling.
+    '''
+    return {toKey(code): codeMap[code] for code in codeMap}
@@ -0,0 +1,105 @@
+from typing import List
+from DudoInfoSet import CHILDREN, HISTORY_MASK, PLAYER, ROLL_SHIFT
+from DudoUpdateRule import UpdateRule
+
+# Root, 12 claims and dudo
+MAX_DEPTH = 14
+
+
+class IterativeCfr():
+    '''
+    cfr as a loop over an explicit stack. Every depth has its own preallocated frame
+    (node, strategy, reach probabilities, current action, util buffer), so a traversal builds
+    no lists and makes no Python calls per node apart from the update rule and returnPayoff.
+    Performs the same floating point operations in the same order as DudoTrainer.cfr.
+    nodes is indexed by DudoInfoSet code, see DudoInfoSet.nodeList.
+    '''
+
+    def __init__(self, nodes: list, rule: UpdateRule = None):
+        self.nodes = nodes
+        self.rule = UpdateRule() if rule is None else rule
+        self.nodeBuf = [None] * MAX_DEPTH
+        self.strategyBuf = [None] * MAX_DEPTH
+        self.childrenBuf = [()] * MAX_DEPTH
+        self.playerBuf = [0] * MAX_DEPTH
+        self.nextRollBuf = [0] * MAX_DEPTH
+        self.p0Buf = [0.] * MAX_DEPTH
+        self.p1Buf = [0.] * MAX_DEPTH
+        self.weightBuf = [0.] * MAX_DEPTH
+        self.actionBuf = [0] * MAX_DEPTH
+        self.nodeUtilBuf = [0.] * MAX_DEPTH
+        self.utilBuf = [[0.] * 12 for _ in range(MAX_DEPTH)]
+
+    def run(self, rolledDice: List[int]) -> float:
+        '''
+        One iteration of cfr for the sampled dice, returns the utility of player 0.
+        '''
+        nodes, rule = self.nodes, self.rule
+        nodeBuf, strategyBuf, childrenBuf, playerBuf = self.nodeBuf, self.strategyBuf, self.childrenBuf, self.playerBuf
+        nextRollBuf, p0Buf, p1Buf, weightBuf = self.nextRollBuf, self.p0Buf, self.p1Buf, self.weightBuf
+        actionBuf, nodeUtilBuf, utilBuf = self.actionBuf, self.nodeUtilBuf, self.utilBuf
+        rollCode = ((rolledDice[0] - 1) << ROLL_SHIFT, (rolledDice[1] - 1) << ROLL_SHIFT)
+
+        depth = 0
+        code = rollCode[0]
+        p0 = p1 = 1
+        while True:
+            history = code & HISTORY_MASK
+            curr_node = nodes[code]
+            curr_node.times_visited += 1
+
+            if not history & 1:
+                # Enter a decision node: fill its frame and descend into the first action.
+                curr_player = PLAYER[history]
+                realization_weight = p1 if curr_player == 0 else p0
+                curr_node.count_realization += 1
+                curr_node.realization_sum += realization_weight
+                strategy = rule.getStrategy(curr_node, p0 if curr_player == 0 else p1)
+                children = CHILDREN[history]
+                nodeBuf[depth] = curr_node
+                strategyBuf[depth] = strategy
+                childrenBuf[depth] = children
+                playerBuf[depth] = curr_player
+                nextRollBuf[depth] = rollCode[1 - curr_player]
+                p0Buf[depth] = p0
+                p1Buf[depth] = p1
+                weightBuf[depth] = realization_weight
+                actionBuf[depth] = 0
+                nodeUtilBuf[depth] = 0
+                code = nextRollBuf[depth] | children[0]
+                if curr_player == 0:
+                    p0 = p0 * strategy[0]
+                else:
+                    p1 = p1 * strategy[0]
+                depth += 1
+                continue
+
+            # Terminal node: pass the payoff up until a frame has an action left to visit.
+            value = curr_node.returnPayoff(rolledDice)
+            while True:
+                depth -= 1
+                if depth < 0:
+                    return value
+                a = actionBuf[depth]
+                util = utilBuf[depth]
+                strategy = strategyBuf[depth]
+                util[a] = -value
+                nodeUtilBuf[depth] += strategy[a] * util[a]
+                a += 1
+                children = childrenBuf[depth]
+                NUM_ACTIONS = len(children)
+                if a < NUM_ACTIONS:
+                    actionBuf[depth] = a
+                    code = nextRollBuf[depth] | children[a]
+                    if playerBuf[depth] == 0:
+                        p0 = p0Buf[depth] * strategy[a]
+                        p1 = p1Buf[depth]
+                    else:
+                        p0 = p0Buf[depth]
+                        p1 = p1Buf[depth] * strategy[a]
+                    depth += 1
+                    break
+                # All actions visited, accumulate counterfactual regret.
+                nodeUtil = nodeUtilBuf[depth]
+                rule.accumulateRegret(nodeBuf[depth], util, nodeUtil, weightBuf[depth], range(NUM_ACTIONS))
+                value = nodeUtil
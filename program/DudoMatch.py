@@ -0,0 +1,148 @@
+'''
+Head-to-head matches between two trained policies.
+Games are played in bulk: every step, each unfinished game looks up the action distribution
+of the player to act in a (NUM_CODES, 12) table of its policy (see DudoPolicy.strategyTable)
+and samples an action, so a chunk of games takes at most 13 array steps. Each deal is played
+twice with the seats swapped, which cancels most of the luck of the dice; confidence intervals
+are taken over these pairs. Chunks can be spread over processes, the result only depends on
+the seed and the number of games.
+
+python DudoMatch.py <policy A> <policy B> [--games 1000000] [--workers 4] [--seed 0]
+A policy is a checkpoint or pickled nodeMap, a DudoPolicy table (.npy) or a DudoQuantized policy (.npz).
+'''
+import argparse
+import math
+import multiprocessing
+import time
+from os import cpu_count
+from typing import Tuple
+import numpy as np
+from DudoInfoSet import CHILDREN, NUM_ACTIONS_OF, NUM_CODES, NUM_HISTORIES, PLAYER, ROLL_SHIFT, terminalPayoff
+from DudoPolicy import MAX_ACTIONS, loadTree, strategyTable
+
+# CHILD[history][a] is CHILDREN[history][a].
+CHILD = np.zeros((NUM_HISTORIES, MAX_ACTIONS), dtype=np.int64)
+for _history, _children in enumerate(CHILDREN):
+    CHILD[_history, :len(_children)] = _children
+PLAYER_OF = np.array(PLAYER, dtype=np.int64)
+# Games per chunk: chunks are the unit of work of the processes and fix the random streams.
+CHUNK = 2 ** 16
+
+
+def loadPolicy(path: str) -> np.ndarray:
+    '''
+    Returns the action distributions of a policy file as a (NUM_CODES, 12) table.
+    '''
+    if path.endswith('.npy'):
+        return np.load(path)
+    if path.endswith('.npz'):
+        from DudoQuantized import QuantizedPolicy
+        return QuantizedPolicy(path).queryBatch(np.arange(NUM_CODES))
+    return strategyTable(loadTree(path))
+
+
+def playGames(first: np.ndarray, second: np.ndarray, dice: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    '''
+    Plays one game per row of dice (rolls 1 to 6 of players 0 and 1), first playing player 0.
+    Returns the payoffs of player 0.
+    '''
+    games = len(dice)
+    history = np.zeros(games, dtype=np.int64)
+    active = np.arange(games)
+    rolls = dice - 1
+    while len(active):
+        h = history[active]
+        player = PLAYER_OF[h]
+        code = rolls[active, player] << ROLL_SHIFT | h
+        probabilities = np.where((player == 0)[:, None], first[code], second[code])
+        # Inverse transform sampling, guarded against rows that sum to slightly less than 1.
+        cumulative = np.cumsum(probabilities, axis=1)
+        u = rng.random(len(active)) * cumulative[:, -1]
+        a = np.minimum((cumulative <= u[:, None]).sum(axis=1), NUM_ACTIONS_OF[h] - 1)
+        history[active] = CHILD[h, a]
+        active = active[(history[active] & 1) == 0]
+    payoff = terminalPayoff(history, dice[:, 0], dice[:, 1])
+    return np.where(PLAYER_OF[history] == 0, payoff, -payoff)
+
+
+def playChunk(tableA: np.ndarray, tableB: np.ndarray, seed: int, chunk: int, pairs: int) -> np.ndarray:
+    '''
+    Sufficient statistics of pairs deals, each played with A as player 0 and as player 1:
+    [pairs, sum and sum of squares of A's mean payoff per pair, A's payoff sum as player 0, as player 1].
+    '''
+    rng = np.random.default_rng([seed, chunk])
+    dice = rng.integers(1, 7, size=(pairs, 2))
+    asFirst = playGames(tableA, tableB, dice, rng)
+    asSecond = -playGames(tableB, tableA, dice, rng)
+    pair = (asFirst + asSecond) / 2
+    return np.array([pairs, pair.sum(), (pair ** 2).sum(), asFirst.sum(), asSecond.sum()])
+
+
+_tables = None
+
+
+def initWorker(tableA: np.ndarray, tableB: np.ndarray):
+    global _tables
+    _tables = (tableA, tableB)
+
+
+def _runChunk(args: Tuple[int, int, int]) -> np.ndarray:
+    return playChunk(*_tables, *args)
+
+
+def summarize(statistics: np.ndarray, z: float = 1.96) -> dict:
+    '''
+    Win rate and mean payoff of A with their confidence intervals (normal approximation over deal pairs).
+    >>> summary = summarize(np.array([4, 1., 1., 3., -1.]))
+    >>> summary['meanPayoff'], summary['winRate'], summary['meanPayoffAsFirst'], summary['meanPayoffAsSecond']
+    (0.25, 0.625, 0.75, -0.25)
+    '''
+    pairs, total, squares, first, second = statistics.tolist()
+    mean = total / pairs
+    variance = max(squares / pairs - mean ** 2, 0.) * pairs / max(pairs - 1, 1)
+    half = z * math.sqrt(variance / pairs)
+    # Payoffs are 1 or -1, so the win rate is (payoff + 1) / 2.
+    return dict(games=int(2 * pairs), meanPayoff=mean, meanPayoffCI=(mean - half, mean + half),
+                winRate=(mean + 1) / 2, winRateCI=((mean - half + 1) / 2, (mean + half + 1) / 2),
+                meanPayoffAsFirst=first / pairs, meanPayoffAsSecond=second / pairs)
+
+
+def match(tableA: np.ndarray, tableB: np.ndarray, games: int = 10 ** 6, seed: int = 0, workers: int = 1) -> dict:
+    '''
+    Plays games between policies A and B (half with A as player 0) and summarizes the results of A.
+    The results depend on (games, seed) only, not on workers.
+    >>> from DudoArrayTree import DudoArrayTree
+    >>> uniform = strategyTable(DudoArrayTree.cached())
+    >>> summary = match(uniform, uniform, 2000)
+    >>> summary['games'], summary['meanPayoffCI'][0] < 0 < summary['meanPayoffCI'][1]
+    (2000, True)
+    '''
+    pairs = games // 2
+    chunks = [(seed, chunk, min(CHUNK, pairs - start)) for chunk, start in enumerate(range(0, pairs, CHUNK))]
+    if workers is None:
+        workers = cpu_count()
+    if workers > 1 and len(chunks) > 1:
+        with multiprocessing.Pool(min(workers, len(chunks)), initializer=initWorker, initargs=(tableA, tableB)) as pool:
+            statistics = pool.map(_runChunk, chunks)
+    else:
+        statistics = [playChunk(tableA, tableB, *chunk) for chunk in chunks]
+    return summarize(np.sum(statistics, axis=0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Head-to-head match of two Dudo policies.')
+    parser.add_argument('policyA')
+    parser.add_argument('policyB')
+    parser.add_argument('--games', type=int, default=10 ** 6)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start_time = time.time()
+    summary = match(loadPolicy(args.policyA), loadPolicy(args.policyB), args.games, args.seed, args.workers)
+    print(f"{summary['games']} games of {args.policyA} against {args.policyB}")
+    print(f"Mean payoff {summary['meanPayoff']:+.4f} (95% CI {summary['meanPayoffCI'][0]:+.4f} to "
+          f"{summary['meanPayoffCI'][1]:+.4f}), as player 0 {summary['meanPayoffAsFirst']:+.4f}, "
+          f"as player 1 {summary['meanPayoffAsSecond']:+.4f}")
+    print(f"Win rate {summary['winRate']:.4f} (95% CI {summary['winRateCI'][0]:.4f} to {summary['winRateCI'][1]:.4f})")
+    print("--- %s seconds ---" % (time.time() - start_time))
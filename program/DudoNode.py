@@ -1,5 +1,5 @@
 from typing import List
-from DudoUtil import rankCount
+from DudoPayoff import ALL_CLAIMS, PAYOFF, claimStrength
 
 
 class DudoNode():
@@ -35,12 +35,7 @@ class DudoNode():
         else:
             if self.infoSet[-1] == 'd':
                 return 12
-            number = int(self.infoSet[-1][-3])
-            rank = int(self.infoSet[-1][-1])
-            if rank != 1:
-                return 6 * number + rank - 8
-            else:
-                return 6 * number - 1
+            return claimStrength(self.infoSet[-1])
 
     def availableChoices(self) -> List[str]:
         '''
@@ -53,16 +48,15 @@ class DudoNode():
         >>> dn.availableChoices()
         []
         '''
-        # All options (except dudo), corresponding to strength 0 to 11
-        allActions = ['1*2', '1*3', '1*4', '1*5', '1*6', '1*1', '2*2', '2*3', '2*4', '2*5', '2*6', '2*1']
         prevStrength = self.strength()
         if prevStrength == 12:
             return []
-        return allActions[prevStrength + 1: ] + ['d']
+        return ALL_CLAIMS[prevStrength + 1: ] + ['d']
 
     def returnPayoff(self, rolledDice: List) -> int:
         '''
         Returns the payoff for terminal nodes, raise error if not a terminal node.
+        Looked up in DudoPayoff.PAYOFF, the strength of the claim is parsed on the first call only.
         >>> dn = DudoNode()
         >>> dn.infoSet = ['2', '1*2', '2*3', 'd']
         >>> dn.returnPayoff([3, 1])
@@ -70,15 +64,12 @@ class DudoNode():
         '''
         if not self.isTerminal():
             raise Exception('Not a terminal node.')
-        else:
-            claim = self.infoSet[-2]
-            claimNumber = int(claim[0])
-            claimRank = int(claim[2])
-            actualCount = rankCount(rolledDice)
-            if actualCount[claimRank - 1] >= claimNumber:
-                return 1
-            else:
-                return -1
+        try:
+            claim = self.claim
+        except AttributeError:
+            # Trees pickled before the payoff table don't carry the claim strength.
+            claim = self.claim = claimStrength(self.infoSet[-2])
+        return PAYOFF[claim][rolledDice[0] - 1][rolledDice[1] - 1]
 
 
     def getStrategy(self, realizationWeight: float) -> List[float]:
@@ -100,27 +91,11 @@ class DudoNode():
 
         return self.strategy
 
-    def getStrategyDc(self, realizationWeight: float, iterations:int) -> List[float]:
+    def getStrategyDc(self, realizationWeight: float, iterations: int) -> List[float]:
         '''
-        Get strategy but with linear discount. See Note02.
+        Get strategy but with linear discount, the strategy of iteration t is weighted by t. See Note02.
         '''
-        normalizingSum = 0
-        NUM_ACTIONS = len(self.regretSum)
-        for i in range(NUM_ACTIONS):
-            if self.regretSum[i] > 0:
-                self.strategy[i] = self.regretSum[i]
-            else:
-                self.strategy[i] = 0
-            normalizingSum += self.strategy[i]
-
-        for i in range(NUM_ACTIONS):
-            if normalizingSum > 0:
-                self.strategy[i] /= normalizingSum
-            else:
-                self.strategy[i] = 1 / NUM_ACTIONS
-            self.strategySum[i] += realizationWeight * self.strategy[i]
-
-        return self.strategy
+        return self.getStrategy(iterations * realizationWeight)
 
     def getAverageStrategy(self) -> List[float]:
         NUM_ACTIONS = len(self.regretSum)
@@ -158,11 +133,14 @@ class DudoNode():
             regret = util[a] - avgNodeUtil
             self.regretSum[a] += realizationWeight * regret
 
-    def accumulateAvgRegretDc(self, util: List[float], avgNodeUtil: float, realizationWeight: float, iterations: int):
-        for a in range(len(self.regretSum)):
+    def accumulateAvgRegretDc(self, util: List[float], avgNodeUtil: float, realizationWeight: float, iterations: int, actions=None):
+        '''
+        accumulateAvgRegret but with linear discount, the regret of iteration t is weighted by t.
+        Only the given actions are updated (all by default), as for pruned nodes. See Note02.
+        '''
+        for a in range(len(self.regretSum)) if actions is None else actions:
             regret = util[a] - avgNodeUtil
-            self.regretSum[a] += realizationWeight * regret
-            self.regretSum[a] *= iterations / (iterations + 1)
+            self.regretSum[a] += iterations * realizationWeight * regret
 
     def isTerminal(self):
         return self.infoSet[-1] == 'd'
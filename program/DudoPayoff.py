@@ -0,0 +1,51 @@
+from typing import List
+import numpy as np
+from DudoUtil import rankCount
+
+# All claims (except dudo), corresponding to strength 0 to 11
+ALL_CLAIMS = ['1*2', '1*3', '1*4', '1*5', '1*6', '1*1', '2*2', '2*3', '2*4', '2*5', '2*6', '2*1']
+
+
+def claimStrength(claim: str) -> int:
+    '''
+    Returns the strength of a claim, '1*2' is strength 0, ..., '2*1' is strength 11.
+    >>> claimStrength('1*1'), claimStrength('2*3')
+    (5, 7)
+    '''
+    number = int(claim[-3])
+    rank = int(claim[-1])
+    if rank != 1:
+        return 6 * number + rank - 8
+    else:
+        return 6 * number - 1
+
+
+def _claimHolds(strength: int, d0: int, d1: int) -> bool:
+    claim = ALL_CLAIMS[strength]
+    return rankCount([d0, d1])[int(claim[2]) - 1] >= int(claim[0])
+
+
+# PAYOFF[strength][d0 - 1][d1 - 1] is the payoff of the claimant when the claim is called dudo:
+# 1 if the claim holds for dice (d0, d1), -1 otherwise. PAYOFF_TABLE is the same as an array.
+PAYOFF = [[[1 if _claimHolds(s, d0, d1) else -1 for d1 in range(1, 7)] for d0 in range(1, 7)] for s in range(12)]
+PAYOFF_TABLE = np.array(PAYOFF, dtype=np.int8)
+
+
+def payoff(strength: int, rolledDice: List[int]) -> int:
+    '''
+    Payoff of the claimant of a claim of given strength that was called dudo.
+    >>> payoff(claimStrength('2*3'), [3, 1])
+    1
+    >>> payoff(claimStrength('2*3'), [3, 2])
+    -1
+    '''
+    return PAYOFF[strength][rolledDice[0] - 1][rolledDice[1] - 1]
+
+
+def batchPayoff(strength, dice0, dice1) -> np.ndarray:
+    '''
+    payoff for many dice pairs (and claims) at once, the arguments are broadcast against each other.
+    >>> batchPayoff(7, np.array([3, 3, 2]), np.array([1, 2, 2])).tolist()
+    [1, -1, -1]
+    '''
+    return PAYOFF_TABLE[strength, np.asarray(dice0) - 1, np.asarray(dice1) - 1]
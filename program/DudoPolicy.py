@@ -0,0 +1,108 @@
+'''
+Read-only lookup of trained average strategies.
+exportTable precomputes DudoNode.getAverageStrategy for every information set into a
+(NUM_CODES, 12) float32 table, row = DudoInfoSet code, column = action in the order of the
+node's children. PolicyTable memory-maps that file, so processes on one machine share a
+single copy through the page cache and start without unpickling anything.
+'''
+import random
+import sys
+from functools import lru_cache
+from typing import List, Union
+import numpy as np
+from DudoArrayTree import DudoArrayTree
+from DudoInfoSet import CHILDREN, HISTORY_MASK, NUM_CODES, decode, encode, fromKey
+import DudoCheckpoint
+from DudoUtil import readNodeMap
+
+MAX_ACTIONS = 12
+
+
+def strategyTable(tree: DudoArrayTree) -> np.ndarray:
+    '''
+    Returns the average strategies of tree as a table indexed by code (rows of non-decision codes are zero).
+    '''
+    table = np.zeros((NUM_CODES, MAX_ACTIONS), dtype=np.float32)
+    avgStrategy = tree.averageStrategy()
+    NUM_ACTIONS = np.repeat(tree.numActions, 6)
+    decision = np.flatnonzero(NUM_ACTIONS)
+    rows = np.repeat(tree.codes[decision], NUM_ACTIONS[decision])
+    columns = np.arange(len(avgStrategy)) - np.repeat(tree.offset[decision], NUM_ACTIONS[decision])
+    table[rows, columns] = avgStrategy
+    return table
+
+
+def loadTree(path: str) -> DudoArrayTree:
+    '''
+    Loads a DudoCheckpoint or a pickled nodeMap as a DudoArrayTree.
+    '''
+    if DudoCheckpoint.isCheckpoint(path):
+        return DudoCheckpoint.load(path)[0]
+    return DudoArrayTree.fromNodeMap(readNodeMap(path))
+
+
+def exportTable(treePath: str, tablePath: str):
+    np.save(tablePath, strategyTable(loadTree(treePath)))
+
+
+class PolicyTable():
+    '''
+    Action distributions of a trained tree. Information sets can be given as legacy
+    infoSet lists, str(infoSet) keys or DudoInfoSet codes.
+    >>> import tempfile, os
+    >>> path = os.path.join(tempfile.mkdtemp(), 'policy.npy')
+    >>> np.save(path, strategyTable(DudoArrayTree()))
+    >>> policy = PolicyTable(path)
+    >>> policy.query(['2', '1*6', '2*4'])
+    [0.25, 0.25, 0.25, 0.25]
+    >>> policy.act(['2', '1*6', '2*5'], random.Random(0)) in ['2*6', '2*1', 'd']
+    True
+    '''
+
+    def __init__(self, path: str, cacheSize: int = 4096):
+        self.table = np.load(path, mmap_mode='r')
+        self._lookup = lru_cache(maxsize=cacheSize)(self._lookupCode)
+
+    def _lookupCode(self, code: int) -> tuple:
+        NUM_ACTIONS = len(CHILDREN[code & HISTORY_MASK])
+        return tuple(self.table[code, :NUM_ACTIONS].tolist())
+
+    @staticmethod
+    def code(infoSet: Union[List[str], str, int]) -> int:
+        if isinstance(infoSet, str):
+            return fromKey(infoSet)
+        if isinstance(infoSet, list):
+            return encode(infoSet)
+        return int(infoSet)
+
+    def query(self, infoSet: Union[List[str], str, int]) -> List[float]:
+        '''
+        Returns the action distribution of an information set, in the order of its children.
+        '''
+        return list(self._lookup(self.code(infoSet)))
+
+    def queryBatch(self, infoSets: list) -> np.ndarray:
+        '''
+        Returns the (len(infoSets), 12) rows of many information sets at once, zero-padded
+        beyond each set's number of actions. An integer array of codes is looked up directly.
+        '''
+        if isinstance(infoSets, np.ndarray):
+            codes = infoSets
+        else:
+            codes = np.fromiter((self.code(infoSet) for infoSet in infoSets), dtype=np.int64, count=len(infoSets))
+        return self.table[codes]
+
+    def act(self, infoSet: Union[List[str], str, int], rng=random) -> str:
+        '''
+        Samples an action of the information set, returned as in DudoNode.children.
+        '''
+        code = self.code(infoSet)
+        probabilities = self._lookup(code)
+        a = rng.choices(range(len(probabilities)), weights=probabilities)[0]
+        child = CHILDREN[code & HISTORY_MASK][a]
+        return 'd' if child & 1 else decode(child)[-1]
+
+
+if __name__ == '__main__':
+    # python DudoPolicy.py <checkpoint or pickled nodeMap> <table.npy>
+    exportTable(sys.argv[1], sys.argv[2])
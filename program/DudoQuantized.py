@@ -0,0 +1,141 @@
+'''
+Compact policies for deployment: the average strategies of a trained tree, actions below the 0.01 cut of
+getAverageStrategy dropped, quantized to 8 or 16 bit levels in the slot layout of DudoArrayTree.
+
+python DudoQuantized.py <checkpoint or pickled nodeMap> <policy.npz> [8|16]
+exports the policy and prints its accuracy report.
+'''
+import json
+import os
+import sys
+from functools import lru_cache
+import numpy as np
+from DudoArrayTree import DudoArrayTree
+from DudoBestResponse import bestResponse
+from DudoEvaluator import TreeLevels
+from DudoInfoSet import CHILDREN, HISTORY_MASK, NUM_ACTIONS_OF, NUM_HISTORIES, ROLL_SHIFT
+from DudoPolicy import MAX_ACTIONS, PolicyTable, loadTree
+
+
+def quantize(avgStrategy: np.ndarray, tree: DudoArrayTree, bits: int = 8) -> np.ndarray:
+    '''
+    Rounds the flat average strategies of tree to integer levels, each information set's summing to 2 ** bits - 1
+    (largest remainder rounding).
+    >>> tree = DudoArrayTree.cached()
+    >>> levels = quantize(tree.averageStrategy(), tree)
+    >>> levels[:6].tolist(), int(levels[:12].sum())
+    ([22, 22, 22, 21, 21, 21], 255)
+    '''
+    scale = 2 ** bits - 1
+    NUM_ACTIONS = np.repeat(tree.numActions, 6)
+    decision = np.flatnonzero(NUM_ACTIONS)
+    segment = np.repeat(np.arange(len(decision)), NUM_ACTIONS[decision])
+    scaled = avgStrategy * scale
+    levels = np.floor(scaled).astype(np.int64)
+    missing = scale - np.bincount(segment, weights=levels, minlength=len(decision)).astype(np.int64)
+    # Within each information set, hand the missing levels to the largest fractional parts.
+    order = np.lexsort((-(scaled - levels), segment))
+    rank = np.arange(len(order)) - np.repeat(tree.offset[decision], NUM_ACTIONS[decision])
+    levels[order[rank < missing[segment]]] += 1
+    return levels.astype(np.uint8 if bits <= 8 else np.uint16)
+
+
+def historyBase(tree: DudoArrayTree) -> np.ndarray:
+    '''
+    First slot of every public history, indexed by its history code.
+    '''
+    # The 49140 slots of the one-die game fit 16 bits.
+    base = np.zeros(NUM_HISTORIES, dtype=np.uint16)
+    base[tree.codes[::6] & HISTORY_MASK] = tree.slotBase
+    return base
+
+
+def exportQuantized(tree: DudoArrayTree, path: str, bits: int = 8, **metadata) -> np.ndarray:
+    '''
+    Writes the quantized average strategy of tree to path and returns its levels.
+    '''
+    if bits not in (8, 16):
+        raise Exception('Policies are quantized to 8 or 16 bits.')
+    levels = quantize(tree.averageStrategy(), tree, bits)
+    metadata = dict(metadata, bits=bits)
+    with open(path, 'wb') as f:
+        np.savez(f, levels=levels, base=historyBase(tree),
+                 metadata=np.frombuffer(json.dumps(metadata).encode(), dtype=np.uint8))
+    return levels
+
+
+class QuantizedPolicy(PolicyTable):
+    '''
+    PolicyTable of an exported quantized policy, with the same queries.
+    >>> import tempfile
+    >>> path = os.path.join(tempfile.mkdtemp(), 'policy.npz')
+    >>> _ = exportQuantized(DudoArrayTree.cached(), path)
+    >>> policy = QuantizedPolicy(path)
+    >>> policy.query(['2', '1*6', '2*4'])
+    [0.25098039215686274, 0.25098039215686274, 0.25098039215686274, 0.24705882352941178]
+    >>> np.allclose(policy.queryBatch([['2', '1*6', '2*4']])[0, :5], policy.query(['2', '1*6', '2*4']) + [0.])
+    True
+    '''
+
+    def __init__(self, path: str, cacheSize: int = 4096):
+        with np.load(path) as data:
+            self.levels, self.base = data['levels'], data['base'].astype(np.int64)
+            self.metadata = json.loads(data['metadata'].tobytes().decode())
+        self.scale = float(2 ** self.metadata['bits'] - 1)
+        self._lookup = lru_cache(maxsize=cacheSize)(self._lookupCode)
+
+    def slots(self, codes: np.ndarray) -> np.ndarray:
+        '''
+        First slot of each code's probabilities.
+        '''
+        history = codes & HISTORY_MASK
+        return self.base[history] + (codes >> ROLL_SHIFT) * NUM_ACTIONS_OF[history]
+
+    def _lookupCode(self, code: int) -> tuple:
+        start = int(self.slots(np.int64(code)))
+        NUM_ACTIONS = len(CHILDREN[code & HISTORY_MASK])
+        return tuple((self.levels[start: start + NUM_ACTIONS] / self.scale).tolist())
+
+    def queryBatch(self, infoSets: list) -> np.ndarray:
+        if isinstance(infoSets, np.ndarray):
+            codes = infoSets.astype(np.int64)
+        else:
+            codes = np.fromiter((self.code(infoSet) for infoSet in infoSets), dtype=np.int64, count=len(infoSets))
+        columns = np.arange(MAX_ACTIONS)
+        valid = columns[None, :] < NUM_ACTIONS_OF[codes & HISTORY_MASK][:, None]
+        slots = np.where(valid, self.slots(codes)[:, None] + columns[None, :], 0)
+        return np.where(valid, self.levels[slots] / self.scale, 0.).astype(np.float32)
+
+    def averageStrategy(self) -> np.ndarray:
+        '''
+        The dequantized policy in the slot layout of DudoArrayTree, as averageStrategy returns it.
+        '''
+        return self.levels / self.scale
+
+
+def accuracyReport(tree: DudoArrayTree, policy: QuantizedPolicy) -> dict:
+    '''
+    Compares a quantized policy with the full precision average strategy of tree: per-action errors,
+    actions dropped by the rounding, and game value and exploitability of both.
+    '''
+    exact, quantized = tree.averageStrategy(), policy.averageStrategy()
+    error = np.abs(quantized - exact)
+    levels = TreeLevels(tree)
+    report = dict(bits=policy.metadata['bits'], maxError=float(error.max()), meanError=float(error.mean()),
+                  droppedActions=int(((exact > 0) & (quantized == 0)).sum()))
+    for name, strategy in (('full', exact), ('quantized', quantized)):
+        report[name] = dict(gameValue=levels.gameValue(strategy),
+                            exploitability=(bestResponse(levels, strategy, 0) + bestResponse(levels, strategy, 1)) / 2)
+    return report
+
+
+if __name__ == '__main__':
+    tree = loadTree(sys.argv[1])
+    bits = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+    exportQuantized(tree, sys.argv[2], bits, source=os.path.basename(sys.argv[1]))
+    report = accuracyReport(tree, QuantizedPolicy(sys.argv[2]))
+    print(f"{os.path.getsize(sys.argv[2]) / 2 ** 10:.1f} KiB, {bits} bit")
+    print(f"Max error {report['maxError']:.5f}, mean error {report['meanError']:.6f}, "
+          f"{report['droppedActions']} actions dropped.")
+    for name in ('full', 'quantized'):
+        print(f"{name}: game value {report[name]['gameValue']}, exploitability {report[name]['exploitability']}")
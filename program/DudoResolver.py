@@ -0,0 +1,120 @@
+'''
+Re-solving of the subgame below a betting history during play.
+The nodes of DudoArrayTree are laid out in preorder, so the public histories below a history,
+and their action slots, form one contiguous range. The resolver copies the regret and strategy
+sums of that range from the stored (blueprint) tree into a working tree and runs the full-width
+iterations of trainerVector on it until the time budget is spent. Both players enter the subgame
+with their blueprint reach probabilities for each roll, so the opponent's range is the one
+implied by its claims so far. The blueprint sums are scaled to weigh as warmIterations iterations,
+so a few milliseconds of iterations can move the strategy: the root information sets of a tree
+trained for T iterations hold strategy sums of about T in total.
+
+python DudoResolver.py <checkpoint or pickled nodeMap> "['3', '1*4', '2*2']" [milliseconds]
+'''
+import sys
+import time
+from typing import List, Tuple
+import numpy as np
+from DudoArrayTree import DudoArrayTree
+from DudoInfoSet import encode
+from DudoPolicy import loadTree
+from trainerVector import cfrVector, prepareTerminals
+
+
+class Resolver():
+    '''
+    Refines the blueprint strategy of tree below given histories.
+    >>> resolver = Resolver(DudoArrayTree.cached())
+    >>> strategy = resolver.resolve(['3', '1*4', '2*2'], seconds=1, maxIterations=200)
+    >>> resolver.iterations, len(strategy), strategy[-1] > .9
+    (200, 6, True)
+    '''
+
+    def __init__(self, tree: DudoArrayTree, warmIterations: float = 100.):
+        self.tree = tree
+        self.warmIterations = warmIterations
+        self.avgStrategy = tree.averageStrategy()
+        self.work = DudoArrayTree.cached()
+        prepareTerminals(self.work)
+        # end[public]: one past the last public history below public.
+        self.end = np.arange(1, tree.numPublic + 1)
+        for public in range(tree.numPublic - 1, -1, -1):
+            if tree.numActions[public]:
+                self.end[public] = self.end[tree.children(public)[-1]]
+        self.slotEnd = np.append(tree.slotBase, len(tree.regretSum))
+        # Strategy sums at the root, about the number of iterations the blueprint was trained for.
+        rootSum = tree.block(tree.strategySum, 0).sum()
+        self.scale = warmIterations / rootSum if rootSum > 0 else 0.
+        self.chance = np.full((6, 6), 1 / 36)
+        self.iterations = 0
+
+    def reach(self, history: List[str]) -> Tuple[int, np.ndarray, np.ndarray]:
+        '''
+        Returns the public index of history and both players' blueprint probabilities of playing to it, by roll.
+        '''
+        tree = self.tree
+        reach = [np.ones(6), np.ones(6)]
+        public = 0
+        for claim in history:
+            a = tree.actions[public].index(claim)
+            reach[tree.player[public]] = reach[tree.player[public]] * tree.block(self.avgStrategy, public)[:, a]
+            public = tree.children(public)[a]
+        return public, reach[0], reach[1]
+
+    def resolve(self, infoSet: List[str], seconds: float = .02, maxIterations: int = None) -> List[float]:
+        '''
+        Returns the refined action distribution of infoSet (own roll first, as in DudoNode.infoSet),
+        in the order of its children. Iterations stop before the one that, taking as long as the average
+        so far, would exceed seconds. Without any iteration (no time left after setting up), the blueprint
+        distribution is returned. self.iterations counts the iterations run.
+        '''
+        t1 = time.perf_counter()
+        roll, history = int(infoSet[0]), infoSet[1:]
+        if history and history[-1] == 'd':
+            raise Exception('No decision after dudo.')
+        public, reach0, reach1 = self.reach(history)
+        start, end = self.slotEnd[public], self.slotEnd[self.end[public]]
+        work = self.work
+        work.regretSum[start: end] = self.tree.regretSum[start: end] * self.scale
+        work.strategySum[start: end] = self.tree.strategySum[start: end] * self.scale
+
+        self.iterations = 0
+        elapsed = 0.
+        while maxIterations is None or self.iterations < maxIterations:
+            spent = time.perf_counter() - t1
+            if spent + (elapsed / self.iterations if self.iterations else 0.) > seconds:
+                break
+            t2 = time.perf_counter()
+            cfrVector(work, public, reach0, reach1, self.chance)
+            elapsed += time.perf_counter() - t2
+            self.iterations += 1
+
+        strategySum = work.block(work.strategySum if self.iterations else self.tree.strategySum, public)[roll - 1]
+        return averageStrategy(strategySum).tolist()
+
+
+def averageStrategy(strategySum: np.ndarray) -> np.ndarray:
+    '''
+    DudoNode.getAverageStrategy of one information set.
+    >>> averageStrategy(np.array([1., 0.005, 3.])).round(6).tolist()
+    [0.25, 0.0, 0.75]
+    '''
+    NUM_ACTIONS = len(strategySum)
+    normalizingSum = strategySum.sum()
+    if normalizingSum <= 0:
+        return np.full(NUM_ACTIONS, 1 / NUM_ACTIONS)
+    avgStrategy = strategySum / normalizingSum
+    avgStrategy[avgStrategy < 0.01] = 0
+    return avgStrategy / avgStrategy.sum()
+
+
+if __name__ == '__main__':
+    import ast
+    resolver = Resolver(loadTree(sys.argv[1]))
+    infoSet = ast.literal_eval(sys.argv[2])
+    seconds = float(sys.argv[3]) / 1000 if len(sys.argv) > 3 else .02
+    node = resolver.tree.nodeByCode(encode(infoSet))
+    print(f"Actions: {node.children}")
+    print(f"Blueprint: {averageStrategy(np.array(node.strategySum)).round(4).tolist()}")
+    print(f"Re-solved: {np.round(resolver.resolve(infoSet, seconds), 4).tolist()} "
+          f"({resolver.iterations} iterations in {seconds * 1000:g} ms)")
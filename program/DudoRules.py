@@ -0,0 +1,171 @@
+'''
+Rules of Dudo variants: dice per player, faces per die and whether ones are wild.
+The claims are ordered as in the one-die game: by quantity, and within a quantity by rank
+with the wild rank highest ('1*2' < ... < '1*6' < '1*1' < '2*2' < ...). A roll is the key of
+a player's dice as used in information sets: its faces in ascending order, '3' or '1-4'.
+ONE_DIE is the game of DudoPayoff and createEmptyTree, with identical claims, payoffs and trees.
+
+LazyNodeMap is a node store for these rules that creates each information set on first lookup,
+so variants whose trees are too large to enumerate can be trained by the sampling trainers.
+'''
+import ast
+import random
+from itertools import combinations_with_replacement
+from math import factorial
+from typing import Dict, List
+import numpy as np
+from DudoNode import DudoNode
+
+
+class DudoRules():
+    '''
+    >>> rules = DudoRules(dicePerPlayer=2)
+    >>> len(rules.claims), len(rules.rolls), rules.claims[:7]
+    (24, 21, ['1*2', '1*3', '1*4', '1*5', '1*6', '1*1', '2*2'])
+    >>> rules.payoff(rules.claimStrength('3*4'), ['1-4', '2-3'])
+    -1
+    >>> rules.payoff(rules.claimStrength('3*4'), ['1-4', '3-4'])
+    1
+    '''
+
+    def __init__(self, dicePerPlayer: int = 1, faces: int = 6, wildOnes: bool = True):
+        self.dicePerPlayer, self.faces, self.wildOnes = dicePerPlayer, faces, wildOnes
+        ranks = list(range(2, faces + 1)) + [1] if wildOnes else list(range(1, faces + 1))
+        self.claims = [f'{number}*{rank}' for number in range(1, 2 * dicePerPlayer + 1) for rank in ranks]
+        self.strength = {claim: s for s, claim in enumerate(self.claims)}
+        dice = list(combinations_with_replacement(range(1, faces + 1), dicePerPlayer))
+        self.rolls = ['-'.join(map(str, roll)) for roll in dice]
+        self.rollIndex = {roll: i for i, roll in enumerate(self.rolls)}
+        self.rollProbability = np.array([self._multinomial(roll) / faces ** dicePerPlayer for roll in dice])
+        # counts[i][r - 1]: dice of roll i that count as rank r.
+        counts = np.array([[sum(1 for d in roll if d == r or (wildOnes and d == 1 and r != 1))
+                            for r in range(1, faces + 1)] for roll in dice])
+        numbers = np.array([int(claim.split('*')[0]) for claim in self.claims])
+        ranks = np.array([int(claim.split('*')[1]) for claim in self.claims])
+        # payoffTable[s][i][j]: payoff of the claimant of claim s called dudo, for rolls i and j.
+        total = counts[None, :, None, :] + counts[None, None, :, :]
+        holds = np.take_along_axis(total, np.broadcast_to((ranks - 1)[:, None, None, None],
+                                                          (len(ranks), len(dice), len(dice), 1)), axis=3)[..., 0]
+        self.payoffTable = np.where(holds >= numbers[:, None, None], 1, -1).astype(np.int8)
+        self.PAYOFF = self.payoffTable.tolist()
+
+    @staticmethod
+    def _multinomial(roll: tuple) -> int:
+        ways = factorial(len(roll))
+        for face in set(roll):
+            ways //= factorial(roll.count(face))
+        return ways
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, DudoRules) and self.describe() == other.describe()
+
+    def __hash__(self) -> int:
+        return hash(tuple(self.describe().items()))
+
+    def describe(self) -> dict:
+        return dict(dicePerPlayer=self.dicePerPlayer, faces=self.faces, wildOnes=self.wildOnes)
+
+    def claimStrength(self, claim: str) -> int:
+        return self.strength[claim]
+
+    def availableChoices(self, infoSet: List[str]) -> List[str]:
+        '''
+        Actions after infoSet: every stronger claim and dudo, dudo is not available before the first claim.
+        >>> ONE_DIE.availableChoices(['2', '1*6'])
+        ['1*1', '2*2', '2*3', '2*4', '2*5', '2*6', '2*1', 'd']
+        '''
+        if len(infoSet) <= 1:
+            return list(self.claims)
+        if infoSet[-1] == 'd':
+            return []
+        return self.claims[self.strength[infoSet[-1]] + 1:] + ['d']
+
+    def sampleRolls(self, rng=random) -> List[str]:
+        '''
+        Rolls of both players. For ONE_DIE these are the draws of the trainers' random.randint(1, 6).
+        '''
+        return ['-'.join(map(str, sorted(rng.randint(1, self.faces) for _ in range(self.dicePerPlayer))))
+                for player in range(2)]
+
+    def payoff(self, strength: int, rolls: List) -> int:
+        '''
+        Payoff of the claimant of a claim of given strength that was called dudo.
+        '''
+        return self.PAYOFF[strength][self.rollIndex[str(rolls[0])]][self.rollIndex[str(rolls[1])]]
+
+    def newNode(self, infoSet: List[str]) -> 'RulesNode':
+        node = RulesNode(self)
+        node.infoSet = infoSet
+        node.children = self.availableChoices(infoSet)
+        NUM_ACTIONS = len(node.children)
+        node.regretSum, node.strategySum, node.strategy = [0] * NUM_ACTIONS, [0] * NUM_ACTIONS, [0] * NUM_ACTIONS
+        return node
+
+    def createTree(self) -> Dict[str, 'RulesNode']:
+        '''
+        Every information set, as createEmptyTree does for the one-die game. Only for small variants.
+        '''
+        tree = dict()
+
+        def createTreeRecursive(infoSet):
+            node = tree[str(infoSet)] = self.newNode(infoSet)
+            for nextAction in node.children:
+                createTreeRecursive(infoSet + [nextAction])
+
+        for roll in self.rolls:
+            createTreeRecursive([roll])
+        return tree
+
+
+class RulesNode(DudoNode):
+    '''
+    DudoNode of a DudoRules game.
+    '''
+
+    def __init__(self, rules: DudoRules):
+        super().__init__()
+        self.rules = rules
+
+    def strength(self) -> int:
+        if len(self.infoSet) <= 1:
+            return -1
+        if self.infoSet[-1] == 'd':
+            return len(self.rules.claims)
+        return self.rules.claimStrength(self.infoSet[-1])
+
+    def availableChoices(self) -> List[str]:
+        return self.rules.availableChoices(self.infoSet)
+
+    def returnPayoff(self, rolledDice: List) -> int:
+        if not self.isTerminal():
+            raise Exception('Not a terminal node.')
+        try:
+            claim = self.claim
+        except AttributeError:
+            claim = self.claim = self.rules.claimStrength(self.infoSet[-2])
+        return self.rules.payoff(claim, rolledDice)
+
+
+class LazyNodeMap(dict):
+    '''
+    nodeMap of str(infoSet) keys that creates nodes when they are first looked up.
+    >>> nodeMap = LazyNodeMap(DudoRules(dicePerPlayer=3))
+    >>> nodeMap["['1-1-6', '2*6', '5*1']"].children
+    ['6*2', '6*3', '6*4', '6*5', '6*6', '6*1', 'd']
+    >>> len(nodeMap)
+    1
+    '''
+
+    def __init__(self, rules: DudoRules):
+        super().__init__()
+        self.rules = rules
+
+    def __missing__(self, key: str) -> RulesNode:
+        node = self[key] = self.rules.newNode(ast.literal_eval(key))
+        return node
+
+    def __reduce__(self):
+        return LazyNodeMap, (self.rules,), None, None, iter(self.items())
+
+
+ONE_DIE = DudoRules()
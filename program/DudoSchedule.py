@@ -0,0 +1,123 @@
+'''
+Convergence-driven schedules for the train functions of DudoTrainer and trainerPruned.
+Instead of a fixed iteration count with a report every 10000 iterations, a schedule decides
+when to evaluate and when to stop. Targets are a stable game value (the last `window`
+evaluations within valueTolerance of each other) and an exploitability bound; training stops
+once every given target is met or the wall-clock budget is spent, and then saves and
+checkpoints as usual. The evaluation interval follows the observed rate of change: about
+the iterations the game value needs to move by valueTolerance (or the exploitability to reach
+its bound), kept between minInterval and maxInterval. Without such a rate (only a time budget,
+or values that do not move), it follows the iteration rate: about a tenth of the budget, and no
+further than the time that remains.
+The game value settles before it is stable: trainerPruned's 'auto' pruning prunes the tree
+and switches to pruned traversal while successive values differ by less than settleTolerance,
+and returns to full traversal if they move more again.
+'''
+import time
+from typing import List, Tuple
+
+
+class ConvergenceSchedule():
+    '''
+    >>> schedule = ConvergenceSchedule(valueTolerance=1e-3, window=3, firstInterval=1000)
+    >>> schedule.due(999), schedule.due(1000)
+    (False, True)
+    >>> schedule.observe(1000, dict(gameValueIteration=1000, gameValue=-0.05))
+    False
+    >>> schedule.observe(2000, dict(gameValueIteration=2000, gameValue=-0.04)), schedule.interval
+    (False, 1000)
+    >>> [schedule.observe(i, dict(gameValueIteration=i, gameValue=-0.0301 + i * 1e-8)) for i in (3000, 8000, 19000)]
+    [False, False, True]
+    >>> schedule.reason
+    'game value stable within 0.001 over 3 evaluations'
+    >>> schedule = ConvergenceSchedule(seconds=100, minInterval=100)
+    >>> schedule.start -= 30
+    >>> schedule.observe(3000, dict(gameValueIteration=3000, gameValue=-0.03)), 900 < schedule.interval <= 1000
+    (False, True)
+    >>> schedule.start -= 65
+    >>> schedule.observe(9500, dict(gameValueIteration=9500, gameValue=-0.03)), 400 < schedule.interval <= 500
+    (False, True)
+    '''
+
+    def __init__(self, valueTolerance: float = None, window: int = 5, exploitabilityBound: float = None,
+                 seconds: float = None, firstInterval: int = 10000, minInterval: int = 1000, maxInterval: int = 200000,
+                 settleTolerance: float = None):
+        if valueTolerance is None and exploitabilityBound is None and seconds is None:
+            raise Exception('A schedule needs a target or a time budget.')
+        self.valueTolerance, self.window, self.exploitabilityBound = valueTolerance, window, exploitabilityBound
+        self.seconds = seconds
+        self.minInterval, self.maxInterval = minInterval, maxInterval
+        self.settleTolerance = settleTolerance if settleTolerance is not None else 10 * (valueTolerance or 1e-3)
+        self.interval = firstInterval
+        self.nextEvaluation = firstInterval
+        self.start = time.time()
+        # (iteration, game value, exploitability) of every evaluation observed.
+        self.history: List[Tuple[int, float, float]] = []
+        self.reason = None
+
+    def outOfTime(self) -> bool:
+        if self.seconds is not None and time.time() - self.start > self.seconds:
+            self.reason = f'time budget of {self.seconds} seconds spent'
+            return True
+        return False
+
+    def due(self, i: int) -> bool:
+        '''
+        Whether the trainer evaluates after its i-th iteration.
+        '''
+        return i >= self.nextEvaluation
+
+    def observe(self, i: int, latest: dict) -> bool:
+        '''
+        Takes the evaluator's latest values after the evaluation at iteration i, sets the next
+        evaluation and returns whether the targets are met. With evaluations in the background,
+        latest can be older than i or None; values are only used once.
+        '''
+        if latest is not None and (not self.history or latest['gameValueIteration'] > self.history[-1][0]):
+            self.history.append((latest['gameValueIteration'], latest['gameValue'], latest.get('exploitability')))
+            self.interval = self.nextInterval(i)
+        self.nextEvaluation = i + self.interval
+        return self.converged()
+
+    def nextInterval(self, i: int) -> int:
+        candidates = []
+        if len(self.history) >= 2:
+            (i0, value0, exploitability0), (i1, value1, exploitability1) = self.history[-2:]
+            valueRate = abs(value1 - value0) / (i1 - i0)
+            if self.valueTolerance is not None and valueRate > 0:
+                candidates.append(self.valueTolerance / valueRate)
+            if self.exploitabilityBound is not None and exploitability0 is not None and exploitability1 is not None:
+                drop = (exploitability0 - exploitability1) / (i1 - i0)
+                if drop > 0 and exploitability1 > self.exploitabilityBound:
+                    candidates.append((exploitability1 - self.exploitabilityBound) / drop)
+        if not candidates and self.seconds is not None:
+            elapsed = time.time() - self.start
+            remaining = max(self.seconds - elapsed, 0)
+            candidates.append(i / max(elapsed, 1e-9) * min(self.seconds / 10, remaining))
+        if not candidates:
+            return self.interval if len(self.history) < 2 else self.maxInterval
+        return int(min(max(min(candidates), self.minInterval), self.maxInterval))
+
+    def settled(self) -> bool:
+        '''
+        Whether the last two game values differ by less than settleTolerance.
+        '''
+        return len(self.history) >= 2 and abs(self.history[-1][1] - self.history[-2][1]) < self.settleTolerance
+
+    def converged(self) -> bool:
+        met = []
+        if self.valueTolerance is not None:
+            values = [value for _, value, _ in self.history[-self.window:]]
+            met.append(len(values) == self.window and max(values) - min(values) <= self.valueTolerance)
+        if self.exploitabilityBound is not None:
+            met.append(bool(self.history) and self.history[-1][2] is not None
+                       and self.history[-1][2] <= self.exploitabilityBound)
+        if met and all(met):
+            reasons = []
+            if self.valueTolerance is not None:
+                reasons.append(f'game value stable within {self.valueTolerance} over {self.window} evaluations')
+            if self.exploitabilityBound is not None:
+                reasons.append(f'exploitability below {self.exploitabilityBound}')
+            self.reason = ', '.join(reasons)
+            return True
+        return False
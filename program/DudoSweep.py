@@ -0,0 +1,150 @@
+'''
+Parallel sweeps over training configurations of trainerPruned.
+A configuration sets the update rule, the pruning ('static' or 'dynamic'), the threshold the
+base tree is pruned with (None keeps every action), the share of pruned iterations and the
+number of iterations. All runs start from one base tree, loaded once in the parent: worker
+processes are forked from it, so its arrays are shared copy-on-write and every run only
+allocates its own nodeMap. Each run writes its progress, log and telemetry to the sweep
+directory; the final game value, exploitability and throughput of all runs are collected into
+one table (results.csv and results.json there).
+
+python DudoSweep.py [--base tree] [--rule cfr,dcfr] [--threshold none,-1000,-10000] [--ratio .95]
+                    [--iterations 100000] [--pruning static] [--workers 4] [--out sweep]
+'''
+import argparse
+import csv
+import json
+import math
+import multiprocessing
+import os
+import random
+import time
+from contextlib import redirect_stdout
+from itertools import product
+from os import cpu_count
+from typing import Dict, List
+import trainerPruned
+from DudoArrayTree import DudoArrayTree
+from DudoBestResponse import exploitability
+from DudoEvaluator import GameValueEvaluator
+from DudoPolicy import loadTree
+from DudoTelemetry import readTelemetry
+from DudoUtil import createEmptyTree, prune, treeTemplate
+
+COLUMNS = ['run', 'rule', 'pruning', 'pruneThreshold', 'prunedRatio', 'iterations', 'seed',
+           'iterationsPerSecond', 'gameValue', 'exploitability']
+
+
+def grid(rule=('cfr',), pruning=('static',), pruneThreshold=(None,), prunedRatio=(.95,), iterations=(10000,),
+         seed=(0,)) -> List[Dict]:
+    '''
+    Every combination of the given values.
+    >>> [(c['rule'], c['pruneThreshold']) for c in grid(rule=['cfr', 'dcfr'], pruneThreshold=[None, -1000])]
+    [('cfr', None), ('cfr', -1000), ('dcfr', None), ('dcfr', -1000)]
+    '''
+    return [dict(rule=r, pruning=p, pruneThreshold=t, prunedRatio=ratio, iterations=n, seed=s)
+            for r, p, t, ratio, n, s in product(rule, pruning, pruneThreshold, prunedRatio, iterations, seed)]
+
+
+_base = None
+
+
+def initWorker(base: DudoArrayTree):
+    # Forked workers get the parent's base without pickling it.
+    global _base
+    _base = base
+
+
+def runConfig(index: int, config: dict, directory: str, keepTree: bool = False) -> dict:
+    '''
+    Trains one configuration from the base tree and returns its row of the comparison table,
+    with the convergence curve of its telemetry as (iteration, game value, exploitability).
+    '''
+    name = f"run{index:03d}"
+    path = os.path.join(directory, name)
+    random.seed(config['seed'])
+    nodeMap = createEmptyTree()
+    if _base is not None:
+        _base.copyToNodeMap(nodeMap)
+    threshold = config['pruneThreshold']
+    prune(nodeMap, -math.inf if threshold is None else threshold)
+    trainerPruned.nodeMap, trainerPruned.iteration, trainerPruned.pruneThreshold = nodeMap, 0, threshold
+    with open(path + '.out', 'w') as out, redirect_stdout(out):
+        t1 = time.time()
+        trainerPruned.train(config['iterations'], path if keepTree else os.devnull, path + '.log',
+                            withExploitability=True, rule=config['rule'], pruning=config['pruning'],
+                            telemetryPath=path + '.jsonl', prunedRatio=config['prunedRatio'])
+        seconds = time.time() - t1
+    evaluator = GameValueEvaluator(nodeMap)
+    records = readTelemetry(path + '.jsonl') if os.path.exists(path + '.jsonl') else []
+    return dict(config, run=name, seconds=seconds, iterationsPerSecond=config['iterations'] / seconds,
+                gameValue=evaluator.gameValue(), exploitability=exploitability(evaluator)[0],
+                curve=[(r['iteration'], r.get('gameValue'), r.get('exploitability')) for r in records])
+
+
+def sweep(configs: List[dict], directory: str, base: DudoArrayTree = None, workers: int = None,
+          keepTrees: bool = False) -> List[dict]:
+    '''
+    Runs configs in parallel from base (an empty tree by default) and writes the comparison table to directory.
+    Returns the rows of the table, best exploitability first.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    # Build the templates once here, forked workers inherit them.
+    treeTemplate()
+    DudoArrayTree.cached()
+    args = [(i, config, directory, keepTrees) for i, config in enumerate(configs)]
+    # A fresh process per run, so no trainer state leaks from one run into the next.
+    with multiprocessing.Pool(min(workers or cpu_count(), len(configs)), initializer=initWorker, initargs=(base,),
+                              maxtasksperchild=1) as pool:
+        rows = pool.starmap(runConfig, args)
+    rows.sort(key=lambda row: row['exploitability'])
+    with open(os.path.join(directory, 'results.json'), 'w') as f:
+        json.dump(rows, f, indent=2)
+    with open(os.path.join(directory, 'results.csv'), 'w', newline='') as f:
+        writer = csv.DictWriter(f, COLUMNS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(rows)
+    return rows
+
+
+def formatTable(rows: List[dict]) -> str:
+    '''
+    >>> print(formatTable([dict(run='run000', rule='cfr', pruning='static', pruneThreshold=None, prunedRatio=.95,
+    ...                         iterations=1000, seed=0, iterationsPerSecond=250.123, gameValue=-0.0271,
+    ...                         exploitability=0.0912)]))
+    run     rule  pruning  pruneThreshold  prunedRatio  iterations  seed  iterationsPerSecond  gameValue  exploitability
+    run000  cfr   static   None            0.95         1000        0     250.1                -0.02710   0.09120
+    '''
+    def cell(name, value):
+        if isinstance(value, float) and name in ('gameValue', 'exploitability'):
+            return f"{value:.5f}"
+        if isinstance(value, float) and name == 'iterationsPerSecond':
+            return f"{value:.1f}"
+        return str(value)
+    cells = [COLUMNS] + [[cell(name, row[name]) for name in COLUMNS] for row in rows]
+    widths = [max(len(line[i]) for line in cells) for i in range(len(COLUMNS))]
+    return '\n'.join('  '.join(c.ljust(w) for c, w in zip(line, widths)).rstrip() for line in cells)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parallel sweep over trainerPruned configurations.')
+    parser.add_argument('--base', help='checkpoint or pickled nodeMap to start from, an empty tree by default')
+    parser.add_argument('--rule', default='cfr', help='comma separated update rules, see DudoUpdateRule')
+    parser.add_argument('--pruning', default='static', help='comma separated, static or dynamic')
+    parser.add_argument('--threshold', default='none', help='comma separated prune thresholds, none for no pruning')
+    parser.add_argument('--ratio', default='.95', help='comma separated shares of pruned iterations')
+    parser.add_argument('--iterations', default='10000', help='comma separated iteration budgets')
+    parser.add_argument('--seed', default='0', help='comma separated seeds')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--out', default='sweep')
+    parser.add_argument('--keep-trees', action='store_true', help='pickle the nodeMap of every run')
+    args = parser.parse_args()
+
+    configs = grid(rule=args.rule.split(','), pruning=args.pruning.split(','),
+                   pruneThreshold=[None if t.lower() == 'none' else float(t) for t in args.threshold.split(',')],
+                   prunedRatio=[float(r) for r in args.ratio.split(',')],
+                   iterations=[int(n) for n in args.iterations.split(',')], seed=[int(s) for s in args.seed.split(',')])
+    start_time = time.time()
+    rows = sweep(configs, args.out, loadTree(args.base) if args.base else None, args.workers, args.keep_trees)
+    print(formatTable(rows))
+    print("--- %s seconds ---" % (time.time() - start_time))
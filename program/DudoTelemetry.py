@@ -0,0 +1,147 @@
+'''
+Structured progress records of the trainers.
+Telemetry appends one JSON line per progress interval: iterations per second, the latest
+game value (and exploitability) of the evaluator, nodes visited, the pruned share of action
+traversals where the trainer prunes, the time spent in traversal, evaluation and IO, and the
+resident memory. Without a path nothing is written and nothing is counted.
+The per-node visit profile is read from the counters the traversals keep on DudoNode anyway
+(times_visited, count_realization, realization_sum), so profiling adds nothing to the hot path:
+switched off, the counters are simply not read.
+'''
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+
+def peakMemory() -> float:
+    '''
+    Peak resident memory of this process in MiB, None where the resource module is missing.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere.
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+
+
+def rssMiB() -> float:
+    '''
+    Resident memory of this process in MiB (the peak where the current value is not available).
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, AttributeError):
+        return peakMemory()
+
+
+class VisitProfiler():
+    '''
+    Visits of every node between two calls of profile, aggregated by depth, with the most visited nodes.
+    '''
+
+    def __init__(self, nodeMap: dict):
+        self.keys = list(nodeMap)
+        self.nodes = [nodeMap[key] for key in self.keys]
+        self.visits = [node.times_visited for node in self.nodes]
+        self.realizations = [node.count_realization for node in self.nodes]
+        self.realizationSums = [node.realization_sum for node in self.nodes]
+
+    def profile(self, top: int = 10) -> dict:
+        depthVisits, depthWeight, depthRealizations = {}, {}, {}
+        hottest = []
+        for i, node in enumerate(self.nodes):
+            visits = node.times_visited - self.visits[i]
+            if not visits:
+                continue
+            self.visits[i] = node.times_visited
+            realizations = node.count_realization - self.realizations[i]
+            weight = node.realization_sum - self.realizationSums[i]
+            self.realizations[i], self.realizationSums[i] = node.count_realization, node.realization_sum
+            depth = len(node.infoSet) - 1
+            depthVisits[depth] = depthVisits.get(depth, 0) + visits
+            depthRealizations[depth] = depthRealizations.get(depth, 0) + realizations
+            depthWeight[depth] = depthWeight.get(depth, 0) + weight
+            hottest.append((visits, i))
+        hottest.sort(reverse=True)
+        return dict(visitsByDepth={depth: depthVisits[depth] for depth in sorted(depthVisits)},
+                    meanRealizationWeightByDepth={depth: depthWeight[depth] / depthRealizations[depth]
+                                                  for depth in sorted(depthRealizations) if depthRealizations[depth]},
+                    hottest=[[self.keys[i], visits] for visits, i in hottest[:top]])
+
+
+class Telemetry():
+    '''
+    JSONL metrics of a training run, appended to path at every record call.
+    >>> from DudoUtil import createEmptyTree
+    >>> telemetry = Telemetry(None, createEmptyTree())
+    >>> with telemetry.section('io'):
+    ...     pass
+    >>> telemetry.record(10000) is None
+    True
+    '''
+
+    def __init__(self, path: str, nodeMap: dict, trainer: str = None, profile: bool = False, iteration: int = 0):
+        '''
+        iteration is the trainer's iteration count when the run starts (a resumed run counts on).
+        '''
+        self.path = path
+        self.trainer = trainer
+        self.enabled = path is not None
+        # Lazy node stores grow, so nodes are listed again at every count.
+        self.nodeMap = nodeMap if self.enabled else {}
+        self.profiler = VisitProfiler(nodeMap) if self.enabled and profile else None
+        self.visits = self.countVisits()
+        self.seconds = dict(evaluation=0., io=0.)
+        self.start = self.last = time.time()
+        self.lastIteration = iteration
+
+    def countVisits(self) -> int:
+        return sum(node.times_visited for node in self.nodeMap.values())
+
+    @contextmanager
+    def section(self, name: str):
+        '''
+        Times a non-traversal part of the loop ('evaluation' or 'io'), the rest of an interval is traversal.
+        '''
+        t1 = time.time()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.) + time.time() - t1
+
+    def record(self, iteration: int, evaluator=None, **extra) -> Dict:
+        '''
+        Writes the record of the interval since the last call. evaluator is the run's GameValueEvaluator,
+        extra holds trainer specific metrics such as prunedShare.
+        '''
+        if not self.enabled:
+            return None
+        now = time.time()
+        elapsed = now - self.last
+        visits = self.countVisits()
+        seconds = dict(self.seconds)
+        seconds['traversal'] = max(elapsed - sum(seconds.values()), 0.)
+        metrics = dict(time=now, elapsed=now - self.start, trainer=self.trainer, iteration=iteration,
+                       iterationsPerSecond=(iteration - self.lastIteration) / elapsed if elapsed > 0 else None,
+                       nodesVisited=visits - self.visits, seconds=seconds, rssMiB=rssMiB())
+        if evaluator is not None and evaluator.latest is not None:
+            metrics.update(evaluator.latest)
+        metrics.update(extra)
+        if self.profiler is not None:
+            metrics['profile'] = self.profiler.profile()
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(metrics) + '\n')
+        self.visits, self.last, self.lastIteration = visits, now, iteration
+        self.seconds = dict(evaluation=0., io=0.)
+        return metrics
+
+
+def readTelemetry(path: str) -> List[dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
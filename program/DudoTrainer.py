@@ -2,35 +2,163 @@ import random
 from typing import *
 import pickle
 from os import getcwd
+import time
 from DudoUtil import createEmptyTree, gameValue, resetSS, readNodeMap
+from DudoInfoSet import CHILDREN, HISTORY_MASK, PLAYER, ROLL_SHIFT, nodeList as codeNodeList
+from DudoIterative import IterativeCfr
+from DudoBatch import BatchCfr
+import DudoCheckpoint
+from DudoEvaluator import evaluatorFor
+from DudoRules import DudoRules, LazyNodeMap, ONE_DIE
+from DudoUpdateRule import UpdateRule, makeRule
+from DudoTelemetry import Telemetry
+from DudoSchedule import ConvergenceSchedule
 
-nodeMap = createEmptyTree()
+# Built by train (or set by the caller), not at import: importing cfr is free.
+nodeMap = None
+# nodeMap indexed by DudoInfoSet code, used by cfrEncoded and IterativeCfr
+nodeList = None
+log = []
+# Total iterations trained on nodeMap, as far as known. Recorded in checkpoints.
+iteration = 0
+# Strategy and regret updates of the traversals, see DudoUpdateRule.
+updateRule = UpdateRule()
 
-def continueTrain(file, iterations: int, savePath):
-    global nodeMap, log
+def continueTrain(file, iterations: int, savePath, engine: str = 'recursive',
+                  checkpointPath: str = None, checkpointEvery: int = None, evalInBackground: bool = False,
+                  withExploitability: bool = False, rule=None, telemetryPath: str = None, profile: bool = False,
+                  rules: DudoRules = None, schedule: ConvergenceSchedule = None, batchSize: int = 1):
+    '''
+    file is a pickled nodeMap or a DudoCheckpoint, in which case the iteration count,
+    the random state and, unless rule is given, the update rule are restored as well.
+    A resumed run trains the same tree as one that was not interrupted, DCFR discounts included:
+    >>> import os, tempfile, numpy as np, DudoTrainer
+    >>> from DudoArrayTree import DudoArrayTree
+    >>> def sums():
+    ...     return [a.copy() for a in DudoArrayTree.cached().gatherFromNodeMap(DudoTrainer.nodeMap)[:2]]
+    >>> directory = tempfile.TemporaryDirectory()
+    >>> cwd = os.getcwd(); os.chdir(directory.name)
+    >>> random.seed(1); train(21, 'full.pkl', rule='dcfr'); full = sums()
+    >>> DudoTrainer.nodeMap, DudoTrainer.iteration = None, 0
+    >>> random.seed(1); train(11, 'half.pkl', rule='dcfr', checkpointPath='half.npz')
+    >>> continueTrain('half.npz', 11, 'resumed.pkl'); resumed = sums()
+    >>> [np.allclose(a, b, rtol=0, atol=1e-12) for a, b in zip(full, resumed)]
+    [True, True]
+    >>> os.chdir(cwd); directory.cleanup()
+    '''
+    global nodeMap, log, iteration
     log = []
-    nodeMap = readNodeMap(file)
-    train(iterations, savePath)
+    if DudoCheckpoint.isCheckpoint(file):
+        nodeMap, metadata = DudoCheckpoint.loadNodeMap(file)
+        iteration = metadata['iteration'] or 0
+        if metadata['rng'] is not None:
+            DudoCheckpoint.restoreRandom(metadata)
+        if rule is None:
+            rule = metadata.get('rule')
+    else:
+        nodeMap = readNodeMap(file)
+    train(iterations, savePath, engine, checkpointPath, checkpointEvery, evalInBackground, withExploitability, rule,
+          telemetryPath, profile, rules, schedule, batchSize)
 
 
-def train(iterations: int, savePath):
+def train(iterations: int, savePath, engine: str = 'recursive',
+          checkpointPath: str = None, checkpointEvery: int = None, evalInBackground: bool = False,
+          withExploitability: bool = False, rule=None, telemetryPath: str = None, profile: bool = False,
+          rules: DudoRules = None, schedule: ConvergenceSchedule = None, batchSize: int = 1):
+    '''
+    engine selects the traversal: 'recursive' is cfr on str(infoSet) keys,
+    'encoded' is cfrEncoded on DudoInfoSet codes, 'iterative' is DudoIterative.IterativeCfr.
+    All give the same result.
+    If checkpointPath is given, a checkpoint is written there every checkpointEvery iterations and at the end.
+    evalInBackground evaluates the game value in a background process (see DudoEvaluator),
+    withExploitability adds the exploitability to the progress reports.
+    rule selects the update rule: 'cfr', 'cfr+', 'linear', 'dcfr' or a DudoUpdateRule.UpdateRule.
+    By default the current updateRule is kept.
+    telemetryPath appends JSONL metrics of every progress interval there (see DudoTelemetry),
+    profile adds the per-node visit profile to them.
+    rules trains a DudoRules variant on a new LazyNodeMap, or checks that nodeMap has these rules (a plain dict
+    is ONE_DIE), with the recursive engine. Only ONE_DIE trees are evaluated and checkpointed.
+    With a DudoSchedule.ConvergenceSchedule, iterations is an upper bound: the schedule sets when the
+    game value is evaluated and stops training once its targets are met or its time is up.
+    With a batchSize above 1, the dice of batchSize iterations are collected and trained in one
+    DudoBatch.BatchCfr walk instead of engine (ONE_DIE trees only); a batch still counts as batchSize
+    iterations, and a partial batch is trained before progress reports, checkpoints and the save.
+    '''
+    global nodeMap, nodeList, iteration, updateRule
+    if rule is not None:
+        updateRule = makeRule(rule)
+    if rules is not None and nodeMap is None:
+        nodeMap = LazyNodeMap(rules)
+    elif rules is not None and getattr(nodeMap, 'rules', ONE_DIE) != rules:
+        raise Exception(f'nodeMap holds {getattr(nodeMap, "rules", ONE_DIE).describe()}, not {rules.describe()}.')
+    if nodeMap is None:
+        nodeMap = createEmptyTree()
+    rules = getattr(nodeMap, 'rules', None)
+    if batchSize > 1 and rules is not None:
+        raise Exception('Batched traversal trains ONE_DIE trees only.')
+    if rules is not None and engine != 'recursive':
+        raise Exception("DudoRules variants train with the 'recursive' engine only.")
+    if rules not in (None, ONE_DIE) and checkpointPath:
+        raise Exception('Checkpoints hold the one-die game only, pickle the nodeMap of other variants.')
+    if rules not in (None, ONE_DIE) and schedule is not None and (
+            schedule.valueTolerance is not None or schedule.exploitabilityBound is not None):
+        raise Exception('Variants are not evaluated, only a time budget schedule applies to them.')
+    if schedule is not None and schedule.exploitabilityBound is not None:
+        withExploitability = True
+    evaluator = evaluatorFor(nodeMap, withExploitability)
+    telemetry = Telemetry(telemetryPath, nodeMap, f"cfr batch {batchSize}" if batchSize > 1 else 'cfr ' + engine, profile,
+                          iteration)
+    if engine in ('encoded', 'iterative') or batchSize > 1:
+        nodeList = codeNodeList(nodeMap)
+    if engine == 'iterative':
+        iterativeCfr = IterativeCfr(nodeList, updateRule)
+    batchCfr = BatchCfr(nodeList, updateRule) if batchSize > 1 else None
+    batch = []
     t1 = time.time()
+    reported = 0
     util = 0
     for i in range(1, iterations):
+        if schedule is not None and schedule.outOfTime():
+            break
         # Sample an outcome of roll. First one is self rolled, second is opponent.
-        rolledDice = [random.randint(1, 6), random.randint(1, 6)]
-        util += cfr(rolledDice, [str(rolledDice[0])], 1, 1)
+        rolledDice = rules.sampleRolls() if rules else [random.randint(1, 6), random.randint(1, 6)]
+        updateRule.startIteration(iteration + 1)
+        if batchCfr is not None:
+            batch.append(rolledDice)
+            if len(batch) == batchSize:
+                util += runBatch(batchCfr, batch)
+        elif engine == 'encoded':
+            util += cfrEncoded(rolledDice, (rolledDice[0] - 1) << ROLL_SHIFT, 1, 1)
+        elif engine == 'iterative':
+            util += iterativeCfr.run(rolledDice)
+        else:
+            util += cfr(rolledDice, [str(rolledDice[0])], 1, 1)
+        iteration += 1
+        evaluate = i % 10000 == 0 if schedule is None else schedule.due(i)
+        checkpoint = checkpointEvery and i % checkpointEvery == 0
+        if batch and (checkpoint or evaluate):
+            util += runBatch(batchCfr, batch)
+        if checkpoint:
+            with telemetry.section('io'):
+                saveCheckpoint(checkpointPath, engine)
         # Reset strategy sum
         # if iterations == 0:
         #     resetSS(nodeMap)
 
         # Progress
-        if i % (10000) == 0:
-            print(f"Dudo trained {i} iterations. {str(10000 / (time.time() - t1))} iterations per second.")
-            print("Theoretical game value: " + str(gameValue(nodeMap)))
-            log.append(f"Dudo trained {i} iterations. {str(10000 / (time.time() - t1))} iterations per second.")
-            log.append("Theoretical game value: " + str(gameValue(nodeMap)))
+        if evaluate:
+            print(f"Dudo trained {i} iterations. {str((i - reported) / (time.time() - t1))} iterations per second.")
+            log.append(f"Dudo trained {i} iterations. {str((i - reported) / (time.time() - t1))} iterations per second.")
+            with telemetry.section('evaluation'):
+                lines = evaluator.report(i, evalInBackground)
+            for line in lines:
+                print(line)
+                log.append(line)
+            telemetry.record(iteration, evaluator)
+            reported = i
             t1 = time.time()
+            if schedule is not None and schedule.observe(i, evaluator.latest):
+                break
     # print("Theoretical game value: " + str(gameValue(nodeMap)))
     #     if i % (10 ** 6) == 0:
     #         name_log = f"log-dt500kDc{i}"
@@ -39,13 +167,38 @@ def train(iterations: int, savePath):
     #         with open(name_log, 'wb') as f:
     #             pickle.dump(log, f)
 
+    for line in evaluator.collect(wait=True):
+        print(line)
+        log.append(line)
+    evaluator.close()
+    if schedule is not None and schedule.reason:
+        print(f"Stopped at iteration {iteration}: {schedule.reason}.")
+        log.append(f"Stopped at iteration {iteration}: {schedule.reason}.")
+
     # Save the trained algorithm
+    if batch:
+        util += runBatch(batchCfr, batch)
+    updateRule.flush(nodeMap.values())
+    if checkpointPath:
+        saveCheckpoint(checkpointPath, engine)
     with open(savePath, 'wb') as f:
         pickle.dump(nodeMap, f)
     name_log = f"log-dt500kDc3.5M2"
     with open(name_log, 'wb') as f:
         pickle.dump(log, f)
 
+def saveCheckpoint(path: str, engine: str):
+    updateRule.flush(nodeMap.values())
+    DudoCheckpoint.save(path, nodeMap, DudoCheckpoint.trainingState(iteration, 'cfr', engine=engine, rule=updateRule.describe()))
+
+def runBatch(batchCfr: BatchCfr, batch: list, pruned: bool = False) -> float:
+    '''
+    Trains the collected dice of batch in one walk and empties it.
+    '''
+    util = batchCfr.run(batch, pruned)
+    batch.clear()
+    return util
+
 def cfr(rolledDice: List[float], infoSet: List[str], p0: float, p1: float) -> float:
     '''
     Returns the counterfactual regret of the information set.
@@ -70,9 +223,9 @@ def cfr(rolledDice: List[float], infoSet: List[str], p0: float, p1: float) -> fl
     curr_node.realization_sum += realization_weight
     # curr_node.realization_sum += realization_weight * (iteration) / (iteration + 1)
     # This gets the current strategy based on regretSum,
-    # also adds the regret sum to the cumulative regretSum
+    # also adds it to the strategySum, weighted by the player's own reach probability
 
-    strategy = curr_node.getStrategy(realization_weight)
+    strategy = updateRule.getStrategy(curr_node, p0 if curr_player == 0 else p1)
 
     # nodeUtil is the weighted average of the cfr of each branch,
     # weighted by the probability of traversing down a branch
@@ -94,18 +247,50 @@ def cfr(rolledDice: List[float], infoSet: List[str], p0: float, p1: float) -> fl
         nodeUtil += strategy[a] * util[a]
 
     # For each action, compute and accumulate counterfactual regret
-    # curr_node.accumulateAvgRegret(util, nodeUtil, p1 if curr_player == 0 else p0)
-    # curr_node.accumulateAvgRegretDc(util, nodeUtil, p1 if curr_player == 0 else p0, iteration)
+    updateRule.accumulateRegret(curr_node, util, nodeUtil, realization_weight, range(NUM_ACTIONS))
+
+    return nodeUtil
+
+def cfrEncoded(rolledDice: List[float], code: int, p0: float, p1: float) -> float:
+    '''
+    cfr on DudoInfoSet codes: nodes are looked up in nodeList and children come from
+    DudoInfoSet.CHILDREN, so no infoSet list or key string is built.
+    '''
+    history = code & HISTORY_MASK
+    curr_player = PLAYER[history]
+    other_player = 1 - curr_player
+
+    curr_node = nodeList[code]
+    curr_node.times_visited += 1
+    # Return Payoff for terminal nodes.
+    if history & 1:
+        return curr_node.returnPayoff(rolledDice)
+
+    realization_weight = p1 if curr_player == 0 else p0
+    curr_node.count_realization += 1
+    curr_node.realization_sum += realization_weight
+    strategy = updateRule.getStrategy(curr_node, p0 if curr_player == 0 else p1)
+
+    nodeUtil = 0
+    children = CHILDREN[history]
+    NUM_ACTIONS = len(children)
+    util = [0] * NUM_ACTIONS
+    nextRoll = (rolledDice[other_player] - 1) << ROLL_SHIFT
+
     for a in range(NUM_ACTIONS):
-        regret = util[a] - nodeUtil
-        curr_node.regretSum[a] += realization_weight * regret
+        if curr_player == 0:
+            util[a] = -cfrEncoded(rolledDice, nextRoll | children[a], p0 * strategy[a], p1)
+        else:
+            util[a] = -cfrEncoded(rolledDice, nextRoll | children[a], p0, p1 * strategy[a])
+        nodeUtil += strategy[a] * util[a]
+
+    updateRule.accumulateRegret(curr_node, util, nodeUtil, realization_weight, range(NUM_ACTIONS))
 
     return nodeUtil
 
 if __name__ == '__main__':
     # train(10000)
     # print('long')
-    import time
     start_time = time.time()
     cwd = getcwd()
     continueTrain(cwd + '/trainedTrees/Discounted/dudoTrained-500kDc', 3 * 10 **6, cwd + '/trainedTrees/Discounted/dt-3.5MReg2')
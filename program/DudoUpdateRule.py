@@ -0,0 +1,209 @@
+'''
+Strategy and regret update rules of the cfr traversals.
+A traversal asks the rule for the current strategy of a node (which also accumulates the
+strategy sum, weighted by the player's own reach probability) and hands it the action
+utilities to accumulate regret (weighted by the opponent's reach probability).
+The trainer tells the rule which iteration it is in with startIteration.
+'''
+from math import ceil, exp, log, sqrt
+from typing import Iterable, List
+import numpy as np
+
+
+class UpdateRule():
+    '''
+    Vanilla CFR: regret matching on the summed regrets, uniform averaging.
+    '''
+    name = 'cfr'
+
+    def __init__(self):
+        self.iteration = 1
+
+    def describe(self) -> dict:
+        return {'name': self.name}
+
+    def startIteration(self, iteration: int):
+        self.iteration = iteration
+
+    def getStrategy(self, node, ownReach: float) -> List[float]:
+        return node.getStrategy(ownReach)
+
+    def accumulateRegret(self, node, util: List[float], nodeUtil: float, realizationWeight: float, actions: Iterable[int]):
+        regretSum = node.regretSum
+        for a in actions:
+            regret = util[a] - nodeUtil
+            regretSum[a] += realizationWeight * regret
+
+    def regretWeight(self, realizationWeight: float) -> float:
+        '''
+        Weight of a regret of this iteration in accumulateRegret, used to bound regret growth when pruning.
+        '''
+        return realizationWeight
+
+    def pruneLength(self, regret: float, maxRegret: float) -> int:
+        '''
+        Number of iterations, from the current one on, through which regret provably stays negative
+        when each adds at most regretWeight(1) * maxRegret to it.
+        >>> UpdateRule().pruneLength(-5., 2.)
+        2
+        '''
+        return max(ceil(-regret / maxRegret) - 1, 0)
+
+    def flush(self, nodes: Iterable):
+        '''
+        Brings all nodes up to date before they are saved (only needed by lazy rules).
+        '''
+        pass
+
+
+class LinearCFR(UpdateRule):
+    '''
+    Linear CFR: the regrets and the strategy of iteration t are weighted by t.
+    '''
+    name = 'linear'
+
+    def getStrategy(self, node, ownReach: float) -> List[float]:
+        return node.getStrategyDc(ownReach, self.iteration)
+
+    def accumulateRegret(self, node, util: List[float], nodeUtil: float, realizationWeight: float, actions: Iterable[int]):
+        node.accumulateAvgRegretDc(util, nodeUtil, realizationWeight, self.iteration, actions)
+
+    def regretWeight(self, realizationWeight: float) -> float:
+        return self.iteration * realizationWeight
+
+    def pruneLength(self, regret: float, maxRegret: float) -> int:
+        # The largest n with regret + maxRegret * (t + (t + 1) + ... + (t + n - 1)) < 0.
+        if regret >= 0:
+            return 0
+        t, c = self.iteration, -regret / maxRegret
+        n = int((1 - 2 * t + sqrt((2 * t - 1) ** 2 + 8 * c)) / 2)
+        while n > 0 and n * t + n * (n - 1) / 2 >= c:
+            n -= 1
+        while (n + 1) * t + (n + 1) * n / 2 < c:
+            n += 1
+        return n
+
+
+class CFRPlus(UpdateRule):
+    '''
+    CFR+: regrets are floored at zero after every update, the strategy of iteration t is weighted by t.
+    With the simultaneous updates of the trainers, not the alternating ones of the original.
+    '''
+    name = 'cfr+'
+
+    def getStrategy(self, node, ownReach: float) -> List[float]:
+        return node.getStrategyDc(ownReach, self.iteration)
+
+    def accumulateRegret(self, node, util: List[float], nodeUtil: float, realizationWeight: float, actions: Iterable[int]):
+        regretSum = node.regretSum
+        for a in actions:
+            regret = util[a] - nodeUtil
+            regretSum[a] = max(regretSum[a] + realizationWeight * regret, 0)
+
+
+class DiscountedCFR(UpdateRule):
+    '''
+    DCFR(alpha, beta, gamma): after iteration t, positive regrets are multiplied by
+    t^alpha / (t^alpha + 1), negative regrets by t^beta / (t^beta + 1) and the strategy sum
+    by (t / (t + 1))^gamma. A node only needs its discounts when it is visited, so they are
+    applied lazily: node.discountedAt is the last iteration whose discount the node has.
+    The regrets that dynamic pruning defers (node.pruneGain and node.pruneWeight, see trainerPruned.cfrDynamic)
+    belong to actions whose regret stays negative, and get the discount of negative regrets.
+    After a flush, describe() records that iteration for all nodes as discountedAt, so a rule made
+    from it (as when resuming a checkpoint) continues the discounts where they stopped.
+    >>> rule = DiscountedCFR(discountedAt=9)
+    >>> rule.startIteration(11)
+    >>> rule.start, rule.describe()['discountedAt']
+    (9, 10)
+    '''
+    name = 'dcfr'
+
+    def __init__(self, alpha: float = 1.5, beta: float = 0., gamma: float = 2., discountedAt: int = None):
+        super().__init__()
+        self.alpha, self.beta, self.gamma = alpha, beta, gamma
+        # Nodes without discountedAt (fresh trees, loaded trees) have the discounts through start,
+        # by default they are up to date when the run (re)starts.
+        self.start = discountedAt
+        # logDiscount[e][t] is the sum of log(s^e / (s^e + 1)) over s = 1..t
+        self.logDiscount = {e: np.zeros(1) for e in (alpha, beta)}
+
+    def describe(self) -> dict:
+        description = {'name': self.name, 'alpha': self.alpha, 'beta': self.beta, 'gamma': self.gamma}
+        if self.start is not None:
+            description['discountedAt'] = max(self.iteration - 1, self.start)
+        return description
+
+    def startIteration(self, iteration: int):
+        if self.start is None:
+            self.start = iteration - 1
+        self.iteration = iteration
+
+    def _logDiscount(self, exponent: float, first: int, last: int) -> float:
+        # Sum of log(s^e / (s^e + 1)) for s = first..last
+        if exponent == 0:
+            return (last - first + 1) * -log(2)
+        table = self.logDiscount[exponent]
+        # Grown by doubling, so the sums are the same whichever iteration a run (or a resumed run) starts at.
+        while len(table) <= last:
+            s = np.arange(len(table), 2 * len(table), dtype=np.float64)
+            table = self.logDiscount[exponent] = np.concatenate([table, table[-1] - np.cumsum(np.log1p(s ** -exponent))])
+        return float(table[last] - table[first - 1])
+
+    def discount(self, node):
+        done = self.iteration - 1
+        last = getattr(node, 'discountedAt', self.start)
+        if last > done:
+            # Left by an earlier run that counted further than this one: up to date when this run started.
+            last = self.start
+        if last >= done:
+            return
+        positive = exp(self._logDiscount(self.alpha, last + 1, done))
+        negative = exp(self._logDiscount(self.beta, last + 1, done))
+        regretSum = node.regretSum
+        for a in range(len(regretSum)):
+            regretSum[a] *= positive if regretSum[a] > 0 else negative
+        strategyDiscount = ((last + 1) / (done + 1)) ** self.gamma
+        strategySum = node.strategySum
+        for a in range(len(strategySum)):
+            strategySum[a] *= strategyDiscount
+        pruneGain = getattr(node, 'pruneGain', ())
+        for a in range(len(pruneGain)):
+            if pruneGain[a] is not None:
+                pruneGain[a] *= negative
+                node.pruneWeight[a] *= negative
+        node.discountedAt = done
+
+    def getStrategy(self, node, ownReach: float) -> List[float]:
+        self.discount(node)
+        return node.getStrategy(ownReach)
+
+    def pruneLength(self, regret: float, maxRegret: float) -> int:
+        # Iteration by iteration: the bound gains maxRegret, then is discounted as a negative regret.
+        bound, n = regret, 0
+        while bound + maxRegret < 0:
+            bound = (bound + maxRegret) * exp(self._logDiscount(self.beta, self.iteration + n, self.iteration + n))
+            n += 1
+        return n
+
+    def flush(self, nodes: Iterable):
+        for node in nodes:
+            self.discount(node)
+
+
+RULES = {'cfr': UpdateRule, 'linear': LinearCFR, 'cfr+': CFRPlus, 'dcfr': DiscountedCFR}
+
+
+def makeRule(spec=None) -> UpdateRule:
+    '''
+    Builds a rule from its name, from a describe() dict (as stored in checkpoints) or returns a given rule.
+    >>> makeRule({'name': 'dcfr', 'alpha': 1.5, 'beta': 0.5, 'gamma': 2.0}).describe()
+    {'name': 'dcfr', 'alpha': 1.5, 'beta': 0.5, 'gamma': 2.0}
+    '''
+    if spec is None:
+        return UpdateRule()
+    if isinstance(spec, UpdateRule):
+        return spec
+    if isinstance(spec, str):
+        return RULES[spec]()
+    params = {key: value for key, value in spec.items() if key != 'name'}
+    return RULES[spec['name']](**params)
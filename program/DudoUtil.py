@@ -1,35 +1,85 @@
+import gc
+import os
 import pickle
 from typing import List
 
-def createEmptyTree() -> dict:
+# (key, infoSet, children) of every node of the empty tree, in the order of createEmptyTree. See treeTemplate.
+_template = None
+
+
+def buildTemplate() -> list:
     '''
-    Creates an empty tree for 1DD game.
+    Walks the 1DD game tree once and lists its nodes.
     '''
-    tree = dict()
+    from DudoNode import DudoNode
+    public = []
     rolled = ['1', '2', '3', '4', '5', '6']
-    def createEmptyTreeRecursive(tree, infoSet):
-        from DudoNode import DudoNode
-        node = DudoNode()
-        node.infoSet = infoSet
+    node = DudoNode()
+    def buildRecursive(history):
+        node.infoSet = ['1'] + history
         available = node.availableChoices()
-        if len(infoSet) == 1:
+        if len(history) == 0:
             available.remove('d')
-        NUM_ACTIONS = len(available)
-        node.regretSum, node.strategySum, node.strategy = [0] * NUM_ACTIONS, [0] * NUM_ACTIONS, [0] * NUM_ACTIONS
-        # Careful not to use the following code as it maps the three items to the same list.
-        # Changing the list will change all three!
-        # node.regretSum, node.strategySum, node.strategy = [[0] * NUM_ACTIONS] * 3
-        node.children = available
-        tree[str(infoSet)] = node
-
+        public.append((str(history)[1:], history, available))
         for nextAction in available:
-            newIS = infoSet + [nextAction]
-            createEmptyTreeRecursive(tree, newIS)
-        return tree
+            buildRecursive(history + [nextAction])
+
+    # The walk is the same for every roll.
+    buildRecursive([])
+    return [(f"['{number}'" + (', ' + key if history else ']'), [number] + history, available)
+            for number in rolled for key, history, available in public]
+
+
+def treeTemplate(path: str = None) -> list:
+    '''
+    The template of the empty tree, built once per process (and inherited by forked workers).
+    With path, it is loaded from that file, or built and saved there if the file doesn't exist yet.
+    '''
+    global _template
+    if _template is None:
+        if path is not None and os.path.exists(path):
+            with open(path, 'rb') as f:
+                _template = _withoutGc(pickle.load, f)
+        else:
+            _template = buildTemplate()
+            if path is not None:
+                with open(path, 'wb') as f:
+                    pickle.dump(_template, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return _template
+
+
+def _withoutGc(f, *args):
+    # Creating tens of thousands of objects triggers many useless collections.
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return f(*args)
+    finally:
+        if enabled:
+            gc.enable()
+
 
-    for number in rolled:
-        createEmptyTreeRecursive(tree, [number])
-    return tree
+def createEmptyTree() -> dict:
+    '''
+    Creates an empty tree for 1DD game.
+    The nodes are copied from treeTemplate, with the attributes DudoNode.__init__ and the tree walk would set.
+    >>> tree = createEmptyTree()
+    >>> len(tree), tree["['2', '1*6']"].children
+    (49146, ['1*1', '2*2', '2*3', '2*4', '2*5', '2*6', '2*1', 'd'])
+    '''
+    from DudoNode import DudoNode
+    def copyTemplate(template):
+        tree = dict()
+        new = DudoNode.__new__
+        for key, infoSet, children in template:
+            NUM_ACTIONS = len(children)
+            node = new(DudoNode)
+            node.__dict__ = {'children': list(children), 'times_visited': 0, 'count_realization': 0,
+                             'realization_sum': 0, 'infoSet': list(infoSet),
+                             'regretSum': [0] * NUM_ACTIONS, 'strategySum': [0] * NUM_ACTIONS, 'strategy': [0] * NUM_ACTIONS}
+            tree[key] = node
+        return tree
+    return _withoutGc(copyTemplate, treeTemplate())
 
 
 def rankCount(rolled: List[int]) -> List[int]:
@@ -99,6 +149,9 @@ def prune(nodeMap: dict, threshold: int):
 
 def readNodeMap(filepath: str):
     with open(filepath, 'rb') as f:
-        nodeMap = pickle.load(f)
+        nodeMap = _withoutGc(pickle.load, f)
+    # A pickle has no iteration count, so the DCFR discounts of its nodes start over at the resumed one.
+    for node in nodeMap.values():
+        node.__dict__.pop('discountedAt', None)
     return nodeMap
 
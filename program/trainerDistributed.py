@@ -0,0 +1,253 @@
+'''
+Training across machines. A coordinator holds the regretSum and strategySum arrays of a
+DudoArrayTree and hands out batches of sampled cfr iterations. A worker keeps a local nodeMap,
+loads the coordinator's current tables before a batch, runs it and ships back the change of
+the tables, compressed. The coordinator adds every delta as it arrives, so workers run
+asynchronously on tables that may be a few batches old. Workers can connect and disconnect at
+any time: a batch whose worker leaves is handed out again.
+Connections use multiprocessing.connection, which unpickles what it receives, with an
+authentication key: DUDO_AUTHKEY, or one the coordinator draws at random and prints for the
+workers, which read it from DUDO_AUTHKEY.
+
+python trainerDistributed.py coordinator <host> <port> <iterations> <savePath> [checkpointPath]
+python trainerDistributed.py worker <host> <port>
+localRun runs a coordinator and several worker processes on this machine.
+'''
+import os
+import pickle
+import secrets
+import sys
+import threading
+import time
+import zlib
+from collections import deque
+from multiprocessing import Process
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from typing import List, Tuple
+import numpy as np
+import DudoCheckpoint
+from DudoArrayTree import DudoArrayTree
+from DudoEvaluator import GameValueEvaluator
+from trainerPrunedPar import BatchRunner, checkRule
+
+def authKey() -> bytes:
+    key = os.environ.get('DUDO_AUTHKEY')
+    return key.encode() if key else None
+
+
+def pack(arrays: List[np.ndarray]) -> bytes:
+    '''
+    Compresses float64 arrays, storing only their nonzero entries.
+    >>> a = np.zeros(10); a[3] = 1.5
+    >>> unpack(pack([a, a]), 10)[1].tolist()
+    [0.0, 0.0, 0.0, 1.5, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
+    '''
+    parts = []
+    for array in arrays:
+        index = np.flatnonzero(array).astype(np.int32)
+        parts.append((index.tobytes(), array[index].tobytes()))
+    return zlib.compress(pickle.dumps(parts, protocol=pickle.HIGHEST_PROTOCOL), 1)
+
+
+def unpack(data: bytes, size: int) -> List[np.ndarray]:
+    arrays = []
+    for index, values in pickle.loads(zlib.decompress(data)):
+        array = np.zeros(size)
+        array[np.frombuffer(index, dtype=np.int32)] = np.frombuffer(values, dtype=np.float64)
+        arrays.append(array)
+    return arrays
+
+
+class Coordinator():
+    '''
+    Serves batches of batchSize iterations until iterations are done. Batch b runs with seed f"{seed}-{b}".
+    '''
+
+    def __init__(self, tree: DudoArrayTree, iterations: int, address: Tuple[str, int], batchSize: int = 1000,
+                 seed: int = 0, prunedRatio: float = .95):
+        self.tree = tree
+        self.iterations, self.batchSize, self.seed, self.prunedRatio = iterations, batchSize, seed, prunedRatio
+        self.branches = tree.promisingBranches()
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        self.version = 0
+        self._packed = None
+        self.completed = 0
+        self.issued = 0
+        self.retry = deque()
+        self.stats = dict(workers=0, batches=0, reassigned=0, staleness=0)
+        self.authkey = authKey()
+        if self.authkey is None:
+            self.authkey = secrets.token_hex(16).encode()
+            print(f"Workers connect with DUDO_AUTHKEY={self.authkey.decode()}")
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+
+    def tables(self) -> Tuple[int, bytes]:
+        # Compressed once per version, shared by all workers asking for it.
+        with self.lock:
+            if self._packed is None or self._packed[0] != self.version:
+                self._packed = (self.version, pack([self.tree.regretSum, self.tree.strategySum]))
+            return self._packed
+
+    def nextBatch(self) -> Tuple[int, int]:
+        with self.lock:
+            if self.retry:
+                return self.retry.popleft()
+            if self.issued >= self.iterations:
+                return None
+            batch = (self.issued // self.batchSize, min(self.batchSize, self.iterations - self.issued))
+            self.issued += batch[1]
+            return batch
+
+    def serve(self):
+        '''
+        Accepts workers until all iterations are done, in a background thread.
+        '''
+        def acceptLoop():
+            while not self.done.is_set():
+                try:
+                    connection = self.listener.accept()
+                except (AuthenticationError, OSError, EOFError):
+                    # A client without the key or one that left during the handshake, keep serving the others.
+                    # close sets done before it closes the listener.
+                    continue
+                threading.Thread(target=self.handle, args=(connection,), daemon=True).start()
+        threading.Thread(target=acceptLoop, daemon=True).start()
+
+    def handle(self, connection):
+        with self.lock:
+            self.stats['workers'] += 1
+        batch = None
+        try:
+            # A worker may leave right after the handshake, before or during the setup.
+            connection.send(('setup', len(self.tree.regretSum), self.branches, self.prunedRatio))
+            while not self.done.is_set():
+                batch = self.nextBatch()
+                if batch is None:
+                    # Other workers still run the last batches, one of them may leave.
+                    time.sleep(.1)
+                    continue
+                version, packed = self.tables()
+                connection.send(('batch', batch[0], f"{self.seed}-{batch[0]}", batch[1], version, packed))
+                message, baseVersion, data = connection.recv()
+                regretDelta, strategyDelta = unpack(data, len(self.tree.regretSum))
+                with self.lock:
+                    self.tree.regretSum += regretDelta
+                    self.tree.strategySum += strategyDelta
+                    self.stats['staleness'] += self.version - baseVersion
+                    self.stats['batches'] += 1
+                    self.version += 1
+                    self.completed += batch[1]
+                    if self.completed >= self.iterations:
+                        self.done.set()
+                batch = None
+            connection.send(('stop',))
+        except (EOFError, OSError):
+            # The worker left, its batch goes to the next one asking.
+            if batch is not None:
+                with self.lock:
+                    self.retry.append(batch)
+                    self.stats['reassigned'] += 1
+        finally:
+            with self.lock:
+                self.stats['workers'] -= 1
+            connection.close()
+
+    def close(self):
+        self.done.set()
+        self.listener.close()
+
+
+def train(tree: DudoArrayTree, iterations: int, address: Tuple[str, int] = ('localhost', 0), batchSize: int = 1000,
+          seed: int = 0, prunedRatio: float = .95, started=None, rule=None) -> Coordinator:
+    '''
+    Coordinates training of tree until iterations are done, reporting progress.
+    started(address, authkey) is called once the coordinator listens, e.g. to launch workers.
+    As in trainerPrunedPar, the batches run vanilla cfr and rule must be None or 'cfr'.
+    '''
+    checkRule(rule)
+    coordinator = Coordinator(tree, iterations, address, batchSize, seed, prunedRatio)
+    coordinator.serve()
+    if started is not None:
+        started(coordinator.address, coordinator.authkey)
+    evaluator = GameValueEvaluator(tree)
+    t1 = time.time()
+    previous = 0
+    print_freq = 10000
+    try:
+        while not coordinator.done.wait(1):
+            completed = coordinator.completed
+            if completed // print_freq > previous // print_freq:
+                print(f"Dudo trained {completed} iterations. {str((completed - previous) / (time.time() - t1))} "
+                      f"iterations per second, {coordinator.stats['workers']} workers.")
+                with coordinator.lock:
+                    value = evaluator.gameValue()
+                print("Theoretical game value: " + str(value))
+                previous, t1 = completed, time.time()
+    finally:
+        coordinator.close()
+    stats = coordinator.stats
+    print(f"{stats['batches']} batches, {stats['reassigned']} reassigned, "
+          f"mean staleness {stats['staleness'] / max(stats['batches'], 1):.2f} batches.")
+    return coordinator
+
+
+def work(address: Tuple[str, int], authkey: bytes = None):
+    '''
+    Runs batches for the coordinator at address until it is done. authkey defaults to DUDO_AUTHKEY.
+    '''
+    authkey = authkey or authKey()
+    if authkey is None:
+        raise Exception('Set DUDO_AUTHKEY to the key of the coordinator.')
+    connection = Client(address, authkey=authkey)
+    try:
+        _, NUM_SLOTS, branches, prunedRatio = connection.recv()
+        runner = BatchRunner(branches)
+        while True:
+            message = connection.recv()
+            if message[0] == 'stop':
+                break
+            _, batch, seed, batchSize, version, packed = message
+            regretSum, strategySum = unpack(packed, NUM_SLOTS)
+            deltas = runner.run(regretSum, strategySum, seed, batchSize, prunedRatio)
+            connection.send(('delta', version, pack(list(deltas))))
+    except EOFError:
+        # The coordinator is gone.
+        pass
+    finally:
+        connection.close()
+
+
+def localRun(iterations: int, numWorkers: int = 2, tree: DudoArrayTree = None, batchSize: int = 1000,
+             seed: int = 0) -> DudoArrayTree:
+    '''
+    A coordinator in this process and numWorkers worker processes, all on localhost.
+    '''
+    tree = DudoArrayTree() if tree is None else tree
+    workers = []
+
+    def startWorkers(address, authkey):
+        for _ in range(numWorkers):
+            worker = Process(target=work, args=(address, authkey))
+            worker.start()
+            workers.append(worker)
+    train(tree, iterations, ('localhost', 0), batchSize, seed, started=startWorkers)
+    for worker in workers:
+        worker.join()
+    return tree
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == 'worker':
+        work((sys.argv[2], int(sys.argv[3])))
+    else:
+        start_time = time.time()
+        tree = DudoArrayTree()
+        coordinator = train(tree, int(sys.argv[4]), (sys.argv[2], int(sys.argv[3])))
+        with open(sys.argv[5], 'wb') as f:
+            pickle.dump(tree.toNodeMap(), f)
+        if len(sys.argv) > 6:
+            DudoCheckpoint.save(sys.argv[6], tree, DudoCheckpoint.trainingState(coordinator.completed, 'distributed'))
+        print("--- %s seconds ---" % (time.time() - start_time))
@@ -2,41 +2,189 @@ from typing import List
 import random, pickle
 from os import getcwd
 import time
-from DudoTrainer import cfr
-from DudoUtil import readNodeMap, gameValue
+import DudoTrainer
+from DudoTrainer import cfr, runBatch
+from DudoUtil import createEmptyTree, readNodeMap, gameValue, prune
+from DudoBatch import BatchCfr
+from DudoCompact import CompactTree
+from DudoPayoff import PAYOFF
+import DudoCheckpoint
+from DudoEvaluator import GameValueEvaluator
+from DudoInfoSet import nodeList
+from DudoUpdateRule import UpdateRule, makeRule
+from DudoTelemetry import Telemetry
+from DudoSchedule import ConvergenceSchedule
 import multiprocessing
 
-def continueTrain(file, iterations: int, savePath, log_path):
-    global nodeMap
-    nodeMap = readNodeMap(file)
-    train(iterations, savePath, log_path)
+# Total iterations trained on nodeMap and the threshold it was pruned with, as far as known. Recorded in checkpoints.
+iteration = 0
+pruneThreshold = None
+# Strategy and regret updates of cfrPruned, see DudoUpdateRule.
+updateRule = UpdateRule()
+nodeMap = None
+# Compacted copy of the promising part of nodeMap that cfrCompact trains, see DudoCompact.
+compactTree = None
+# 'auto' pruning prunes actions whose regret is below -autoPruneRate * iteration.
+autoPruneRate = .01
+# Payoff range of the game, bounding how fast the regret of a pruned action can grow.
+MAX_PAYOFF, MIN_PAYOFF = 1, -1
+# Counts of cfrDynamic: action traversals skipped and made, pruned actions traversed again, actions pruned now.
+pruneStats = dict(skipped=0, traversed=0, revisits=0, pruned=0)
+
+def continueTrain(file, iterations: int, savePath, log_path,
+                  checkpointPath: str = None, checkpointEvery: int = None, evalInBackground: bool = False,
+                  withExploitability: bool = False, rule=None, pruning: str = None,
+                  telemetryPath: str = None, profile: bool = False, compact: bool = False, syncEvery: int = 1000,
+                  prunedRatio: float = .95, schedule: ConvergenceSchedule = None, batchSize: int = 1):
+    '''
+    file is a pruned, pickled nodeMap or a DudoCheckpoint of one, in which case the iteration count,
+    the pruning threshold, the random state and, unless given, the update rule and pruning are restored as well.
+    The state of dynamic pruning is kept on the nodes of both.
+    '''
+    global nodeMap, iteration, pruneThreshold
+    if DudoCheckpoint.isCheckpoint(file):
+        nodeMap, metadata = DudoCheckpoint.loadNodeMap(file)
+        iteration = metadata['iteration'] or 0
+        pruneThreshold = metadata['pruneThreshold']
+        if metadata['rng'] is not None:
+            DudoCheckpoint.restoreRandom(metadata)
+        if rule is None:
+            rule = metadata.get('rule')
+        if pruning is None:
+            pruning = metadata.get('pruning')
+    else:
+        nodeMap = readNodeMap(file)
+    # The actions cfrDynamic left pruned, which its revisits count down.
+    pruneStats['pruned'] = sum(gain is not None for node in nodeMap.values() for gain in getattr(node, 'pruneGain', ()))
+    train(iterations, savePath, log_path, checkpointPath, checkpointEvery, evalInBackground, withExploitability, rule,
+          pruning or 'static', telemetryPath, profile, compact, syncEvery, prunedRatio, schedule, batchSize)
     # Save the trained algorithm
 
 
-def train(iterations: int, savePath, log_path):
+def train(iterations: int, savePath, log_path, checkpointPath: str = None, checkpointEvery: int = None,
+          evalInBackground: bool = False, withExploitability: bool = False, rule=None, pruning: str = 'static',
+          telemetryPath: str = None, profile: bool = False, compact: bool = False, syncEvery: int = 1000,
+          prunedRatio: float = .95, schedule: ConvergenceSchedule = None, batchSize: int = 1):
+    '''
+    pruning 'static' runs cfrPruned on the promising_branches set by DudoUtil.prune in a share prunedRatio of the
+    iterations and full cfr in the others, 'dynamic' runs cfrDynamic, which prunes by regret on its own, on any
+    nodeMap (by default an empty tree). 'auto' needs a schedule: it runs full cfr until the schedule finds the
+    game value settled, then prunes at -autoPruneRate * iteration and runs as 'static', pruning again at
+    every evaluation while settled and returning to full cfr when the game value moves again.
+    If checkpointPath is given, a checkpoint is written there every checkpointEvery iterations and at the end.
+    evalInBackground evaluates the game value in a background process (see DudoEvaluator),
+    withExploitability adds the exploitability to the progress reports.
+    rule selects the update rule as in DudoTrainer.train, the full cfr iterations use it too.
+    telemetryPath appends JSONL metrics of every progress interval there (see DudoTelemetry),
+    profile adds the per-node visit profile to them.
+    compact runs the iterations of 'static' pruning with cfrCompact on a CompactTree of nodeMap. The full cfr
+    iterations are then deferred and run together on nodeMap every syncEvery iterations (and before
+    progress reports, checkpoints and the save), between scattering and gathering the compact nodes.
+    With a DudoSchedule.ConvergenceSchedule, iterations is an upper bound: the schedule sets when the
+    game value is evaluated and stops training once its targets are met or its time is up.
+    With a batchSize above 1, the dice of the pruned and of the full iterations are collected separately
+    and every batchSize of them trained in one DudoBatch.BatchCfr walk, as in DudoTrainer.train
+    ('static' and 'auto' pruning, not with compact).
+    '''
+    global iteration, updateRule, nodeMap, compactTree, pruneThreshold
+    if pruning == 'auto' and schedule is None:
+        raise Exception("'auto' pruning follows a ConvergenceSchedule.")
+    if batchSize > 1 and (pruning == 'dynamic' or compact):
+        raise Exception("Batched traversal runs 'static' and 'auto' pruning without compact.")
+    if compact and pruning != 'static':
+        raise Exception("compact runs 'static' pruning only.")
+    if rule is not None:
+        updateRule = makeRule(rule)
+    if nodeMap is None:
+        nodeMap = createEmptyTree()
+    # The full iterations run DudoTrainer.cfr, which must train this nodeMap.
+    DudoTrainer.updateRule = updateRule
+    DudoTrainer.nodeMap = nodeMap
+    if schedule is not None and schedule.exploitabilityBound is not None:
+        withExploitability = True
+    evaluator = GameValueEvaluator(nodeMap, withExploitability)
+    telemetry = Telemetry(telemetryPath, nodeMap, pruning + ' pruning', profile, iteration)
+    counts = dict(pruneStats)
+    compactTree = CompactTree(nodeMap) if compact else None
+    deferred = []
+    batchCfr = BatchCfr(nodeList(nodeMap), updateRule) if batchSize > 1 else None
+    # Dice of the pruned and of the full iterations not trained yet.
+    batches = {True: [], False: []}
+    # Whether the pruned traversal runs, switched by the schedule with 'auto' pruning.
+    pruned = pruning == 'static'
     log = ""
     t1 = time.time()
+    reported = 0
     util = 0
     for i in range(1, iterations):
+        if schedule is not None and schedule.outOfTime():
+            break
         rr = random.random()
         # Sample an outcome of roll. First one is self rolled, second is opponent.
         rolledDice = [random.randint(1, 6), random.randint(1, 6)]
-        if rr < .95:
-            util += cfrPruned(rolledDice, [str(rolledDice[0])], 1, 1)
+        updateRule.startIteration(iteration + 1)
+        if batchCfr is not None:
+            batch = batches[pruned and rr < prunedRatio]
+            batch.append(rolledDice)
+            if len(batch) == batchSize:
+                util += runBatch(batchCfr, batch, batch is batches[True])
+        elif pruning == 'dynamic':
+            util += cfrDynamic(rolledDice, [str(rolledDice[0])], 1, 1)
+        elif pruned and rr < prunedRatio:
+            if compactTree is not None:
+                util += cfrCompact(rolledDice, compactTree.roots[rolledDice[0] - 1], 1, 1)
+            else:
+                util += cfrPruned(rolledDice, [str(rolledDice[0])], 1, 1)
+        elif compactTree is not None:
+            deferred.append(rolledDice)
         else:
             util += cfr(rolledDice, [str(rolledDice[0])], 1, 1)
+        iteration += 1
+        print_freq = 10000
+        evaluate = i % print_freq == 0 if schedule is None else schedule.due(i)
+        checkpoint = checkpointEvery and i % checkpointEvery == 0
+        if compactTree is not None and (i % syncEvery == 0 or checkpoint or evaluate):
+            util += syncCompact(deferred)
+        if batchCfr is not None and (checkpoint or evaluate):
+            util += flushBatches(batchCfr, batches)
+        if checkpoint:
+            with telemetry.section('io'):
+                saveCheckpoint(checkpointPath, pruning)
         # Reset strategy sum
         # if iterations == 0:
         #     resetSS(nodeMap)
 
         # Progress
-        print_freq = 10000
-        if i % (print_freq) == 0:
-            print(f"Dudo trained {i} iterations. {str(print_freq / (time.time() - t1))} iterations per second.")
-            print("Theoretical game value: " + str(gameValue(nodeMap)))
-            log += f"Dudo trained {i} iterations. {str(print_freq / (time.time() - t1))} iterations per second. \n"
-            log += "Theoretical game value: " + str(gameValue(nodeMap)) + "\n"
+        if evaluate:
+            print(f"Dudo trained {i} iterations. {str((i - reported) / (time.time() - t1))} iterations per second.")
+            log += f"Dudo trained {i} iterations. {str((i - reported) / (time.time() - t1))} iterations per second. \n"
+            with telemetry.section('evaluation'):
+                lines = evaluator.report(i, evalInBackground)
+            if pruning == 'dynamic':
+                lines.append(pruneReport())
+            for line in lines:
+                print(line)
+                log += line + "\n"
+            if telemetry.enabled:
+                telemetry.record(iteration, evaluator, prunedShare=prunedShare(pruning, counts))
+            counts = dict(pruneStats)
+            reported = i
             t1 = time.time()
+            if schedule is not None and schedule.observe(i, evaluator.latest):
+                break
+            if pruning == 'auto':
+                if schedule.settled():
+                    pruneThreshold = -autoPruneRate * iteration
+                    prune(nodeMap, pruneThreshold)
+                    line = f"Pruned at threshold {pruneThreshold}, {prunedShare('static', counts):.1%} of actions."
+                elif pruned:
+                    line = "Game value moved, back to full traversal."
+                else:
+                    line = None
+                pruned = schedule.settled()
+                if line:
+                    print(line)
+                    log += line + "\n"
             # print("Theoretical game value: " + str(gameValue(nodeMap)))
         # if i % (10 ** 6) == 0:
         #     name_log = f"log-dt500kDcPruned{i}its"
@@ -45,11 +193,67 @@ def train(iterations: int, savePath, log_path):
         #     with open(name_log, 'wb') as f:
         #         pickle.dump(log, f)
 
+    for line in evaluator.collect(wait=True):
+        print(line)
+        log += line + "\n"
+    evaluator.close()
+    if schedule is not None and schedule.reason:
+        print(f"Stopped at iteration {iteration}: {schedule.reason}.")
+        log += f"Stopped at iteration {iteration}: {schedule.reason}.\n"
+
+    if compactTree is not None:
+        syncCompact(deferred)
+    if batchCfr is not None:
+        flushBatches(batchCfr, batches)
+    updateRule.flush(nodeMap.values())
+    if checkpointPath:
+        saveCheckpoint(checkpointPath, pruning)
     with open(savePath, 'wb') as f:
         pickle.dump(nodeMap, f)
     with open(log_path, 'w') as f:
         f.write(log)
 
+def saveCheckpoint(path: str, pruning: str = 'static'):
+    updateRule.flush(nodeMap.values())
+    DudoCheckpoint.save(path, nodeMap, DudoCheckpoint.trainingState(iteration, 'pruned', pruneThreshold,
+                                                                   rule=updateRule.describe(), pruning=pruning))
+
+def syncCompact(deferred: list) -> float:
+    '''
+    Scatters compactTree into nodeMap, runs the deferred full cfr iterations (their dice) there and gathers it again.
+    '''
+    compactTree.scatter(nodeMap)
+    util = 0
+    for rolledDice in deferred:
+        util += cfr(rolledDice, [str(rolledDice[0])], 1, 1)
+    if deferred:
+        compactTree.gather(nodeMap)
+    deferred.clear()
+    return util
+
+def flushBatches(batchCfr: BatchCfr, batches: dict) -> float:
+    '''
+    Trains the partial batches of pruned (batches[True]) and full iterations.
+    '''
+    return sum(runBatch(batchCfr, batch, pruned) for pruned, batch in batches.items() if batch)
+
+def pruneReport() -> str:
+    total = pruneStats['skipped'] + pruneStats['traversed']
+    return (f"Pruning skipped {pruneStats['skipped'] / max(total, 1):.1%} of action traversals, "
+            f"{pruneStats['revisits']} revisits, {pruneStats['pruned']} actions pruned now.")
+
+def prunedShare(pruning: str, counts: dict) -> float:
+    '''
+    Share of action traversals skipped since pruneStats were counts (dynamic pruning),
+    or share of actions outside promising_branches (static pruning).
+    '''
+    if pruning == 'dynamic':
+        skipped = pruneStats['skipped'] - counts['skipped']
+        return skipped / max(skipped + pruneStats['traversed'] - counts['traversed'], 1)
+    nodes = [node for node in nodeMap.values() if hasattr(node, 'promising_branches') and len(node.regretSum)]
+    NUM_ACTIONS = sum(len(node.regretSum) for node in nodes)
+    return 1 - sum(len(node.promising_branches) for node in nodes) / max(NUM_ACTIONS, 1)
+
 def cfrPruned(rolledDice: List[float], infoSet: List[str], p0: float, p1: float) -> float:
     '''
     Cfr with pruning.
@@ -67,9 +271,9 @@ def cfrPruned(rolledDice: List[float], infoSet: List[str], p0: float, p1: float)
 
     realization_weight = p1 if curr_player == 0 else p0
     # This gets the current strategy based on regretSum,
-    # also adds the regret sum to the cumulative regretSum
+    # also adds it to the strategySum, weighted by the player's own reach probability
 
-    strategy = curr_node.getStrategy(realization_weight)
+    strategy = updateRule.getStrategy(curr_node, p0 if curr_player == 0 else p1)
 
     # nodeUtil is the weighted average of the cfr of each branch,
     # weighted by the probability of traversing down a branch
@@ -91,9 +295,105 @@ def cfrPruned(rolledDice: List[float], infoSet: List[str], p0: float, p1: float)
         nodeUtil += strategy[a] * util[a]
 
     # For each action, compute and accumulate counterfactual regret
-    for a in curr_node.promising_branches:
-        regret = util[a] - nodeUtil
-        curr_node.regretSum[a] += (p1 if curr_player == 0 else p0) * regret
+    updateRule.accumulateRegret(curr_node, util, nodeUtil, realization_weight, curr_node.promising_branches)
+
+    return nodeUtil
+
+def cfrCompact(rolledDice: List[int], i: int, p0: float, p1: float) -> float:
+    '''
+    cfrPruned on node i of compactTree, with the same updates in the same order.
+    '''
+    curr_node = compactTree.nodes[i]
+    curr_node.times_visited += 1
+    curr_player = compactTree.player[i]
+    realization_weight = p1 if curr_player == 0 else p0
+    strategy = updateRule.getStrategy(curr_node, p0 if curr_player == 0 else p1)
+    other_roll = rolledDice[1 - curr_player] - 1
+    util = compactTree.util[i]
+    nodeUtil = 0
+    for a, children in compactTree.next[i]:
+        if type(children) is int:
+            # Dudo, the payoff is the claimant's: the other player's.
+            util[a] = -PAYOFF[children][rolledDice[0] - 1][rolledDice[1] - 1]
+        elif curr_player == 0:
+            util[a] = -cfrCompact(rolledDice, children[other_roll], p0 * strategy[a], p1)
+        else:
+            util[a] = -cfrCompact(rolledDice, children[other_roll], p0, p1 * strategy[a])
+        nodeUtil += strategy[a] * util[a]
+    updateRule.accumulateRegret(curr_node, util, nodeUtil, realization_weight, compactTree.actions[i])
+    return nodeUtil
+
+def cfrDynamic(rolledDice: List[float], infoSet: List[str], p0: float, p1: float) -> float:
+    '''
+    Cfr with regret-based pruning.
+    An action with negative regret and zero probability is skipped through node.pruneUntil, the last of the
+    updateRule.pruneLength iterations in which its regret provably stays negative: each adds at most
+    regretWeight(1) * (MAX_PAYOFF - MIN_PAYOFF) to it. Once they are over (or the action has a probability
+    again), it is traversed again (a revisit) and its regret is caught up.
+    The catch-up is an approximation: the regret of the revisit, extrapolated over the weight of the skipped
+    visits (node.pruneWeight) and capped by the sum of their bounds regretWeight * (MAX_PAYOFF - nodeUtil)
+    (node.pruneGain). The deferred regrets get the discounts of the update rule, see DudoUpdateRule.
+    Pruned actions have zero probability, so nodeUtil is exact. The nodes below a skipped action are not
+    updated while it is skipped, and these updates are not caught up.
+    The pruning state is kept on the nodes, their pickles and DudoCheckpoint checkpoints.
+    '''
+    plays = len(infoSet) - 1
+    curr_player = plays % 2
+    other_player = 1 - curr_player
+
+    curr_node = nodeMap[str(infoSet)]
+    curr_node.times_visited += 1
+    # Return Payoff for terminal nodes.
+    if curr_node.isTerminal():
+        return curr_node.returnPayoff(rolledDice)
+
+    realization_weight = p1 if curr_player == 0 else p0
+    strategy = updateRule.getStrategy(curr_node, p0 if curr_player == 0 else p1)
+
+    NUM_ACTIONS = len(curr_node.regretSum)
+    regretSum = curr_node.regretSum
+    try:
+        pruneGain, pruneWeight, pruneUntil = curr_node.pruneGain, curr_node.pruneWeight, curr_node.pruneUntil
+    except AttributeError:
+        pruneGain = curr_node.pruneGain = [None] * NUM_ACTIONS
+        pruneWeight = curr_node.pruneWeight = [0] * NUM_ACTIONS
+        pruneUntil = curr_node.pruneUntil = [0] * NUM_ACTIONS
+    weight = updateRule.regretWeight(realization_weight)
+    iteration = updateRule.iteration
+
+    nodeUtil = 0
+    util = [0] * NUM_ACTIONS
+    traversed, skipped, revisited = [], [], []
+    for a in range(NUM_ACTIONS):
+        if strategy[a] == 0 and pruneGain[a] is None:
+            length = updateRule.pruneLength(regretSum[a], MAX_PAYOFF - MIN_PAYOFF)
+            if length:
+                pruneGain[a], pruneWeight[a], pruneUntil[a] = 0, 0, iteration + length - 1
+                pruneStats['pruned'] += 1
+        if pruneGain[a] is not None:
+            if strategy[a] == 0 and iteration <= pruneUntil[a]:
+                skipped.append(a)
+                continue
+            revisited.append(a)
+        traversed.append(a)
+        nextIS = [str(rolledDice[other_player])] + infoSet[1:] + [curr_node.children[a]]
+        if curr_player == 0:
+            util[a] = -cfrDynamic(rolledDice, nextIS, p0 * strategy[a], p1)
+        else:
+            util[a] = -cfrDynamic(rolledDice, nextIS, p0, p1 * strategy[a])
+        nodeUtil += strategy[a] * util[a]
+    pruneStats['skipped'] += len(skipped)
+    pruneStats['traversed'] += len(traversed)
+
+    for a in skipped:
+        pruneGain[a] += weight * (MAX_PAYOFF - nodeUtil)
+        pruneWeight[a] += weight
+    for a in revisited:
+        regretSum[a] += min(pruneWeight[a] * (util[a] - nodeUtil), pruneGain[a])
+        pruneGain[a], pruneWeight[a] = None, 0
+        pruneStats['revisits'] += 1
+        pruneStats['pruned'] -= 1
+    updateRule.accumulateRegret(curr_node, util, nodeUtil, realization_weight, traversed)
 
     return nodeUtil
 
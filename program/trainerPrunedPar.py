@@ -1,204 +1,222 @@
-from typing import List
+'''
+Multi-core training. The regretSum and strategySum arrays of a DudoArrayTree live in shared memory.
+Every round, each of numBatches batches starts from these arrays, runs batchSize sampled
+iterations on the nodeMap of a worker process (see BatchRunner) and writes its change of the arrays
+to its own slot of a shared delta buffer. The parent then adds the deltas in batch order. A batch only
+depends on the arrays at the start of the round and on its seed, so the result depends on
+(seed, numBatches, batchSize) and not on the number of processes or on scheduling.
+Batches run vanilla cfr only: adding their deltas relies on updates that are linear in the sums and
+do not depend on the iteration. Linear CFR, CFR+ and DCFR are trained with trainerPruned.
+'''
 import random, pickle
-from os import getcwd
+from itertools import chain
+from os import getcwd, cpu_count
 import time
-from DudoTrainer import cfr
-from DudoUtil import readNodeMap, gameValue
 import multiprocessing
-
-def continueTrain(file, iterations: int, savePath):
-    global nodeMap
-    nodeMap = readNodeMap(file)
-    train(iterations)
+from multiprocessing import shared_memory
+import numpy as np
+import trainerPruned
+from DudoArrayTree import DudoArrayTree
+from DudoInfoSet import nodeList
+from DudoIterative import IterativeCfr
+from DudoUtil import createEmptyTree, readNodeMap, treeTemplate
+from DudoEvaluator import GameValueEvaluator
+from DudoUpdateRule import UpdateRule, makeRule
+
+tree = None
+
+
+def continueTrain(file, iterations: int, savePath, numWorkers: int = None, numBatches: int = None,
+                  batchSize: int = 1000, seed: int = 0, prunedRatio: float = .95, rule=None):
+    global tree
+    checkRule(rule)
+    tree = DudoArrayTree.fromNodeMap(readNodeMap(file))
+    train(iterations, numWorkers, numBatches, batchSize, seed, prunedRatio, rule)
     # Save the trained algorithm
     with open(savePath, 'wb') as f:
-        pickle.dump(nodeMap, f)
-
-def train(iterations: int):
-    t1 = time.time()
-    util = 0
-    with multiprocessing.Pool() as pool:
-        m = multiprocessing.Manager()
-        d = m.dict(nodeMap)
-        for i in range(iterations):
-            rr = random.random()
-            # Sample an outcome of roll. First one is self rolled, second is opponent.
-            rolledDice = [random.randint(1, 6), random.randint(1, 6)]
-            if rr < .95:
-                util += cfrPrunedPar(rolledDice, [str(rolledDice[0])], 1, 1, pool, d, m)
-            else:
-                util += cfr(rolledDice, [str(rolledDice[0])], 1, 1)
-            # Reset strategy sum
-            # if iterations == 0:
-            #     resetSS(nodeMap)
-
-            # Progress
-            print(i)
-            if i % (10000) == 0:
-                print(f"Dudo trained {i} iterations. {str(10000 / (time.time() - t1))} iterations per second.")
-                print("Theoretical game value: " + str(gameValue(nodeMap)))
-                t1 = time.time()
-        for key in d:
-            nodeMap[key] = d[key]
+        pickle.dump(tree.toNodeMap(), f)
 
-def cfrPruned(rolledDice: List[float], infoSet: List[str], p0: float, p1: float) -> float:
-    '''
-    Cfr with pruning.
 
+def train(iterations: int, numWorkers: int = None, numBatches: int = None,
+          batchSize: int = 1000, seed: int = 0, prunedRatio: float = .95, rule=None):
     '''
-    plays = len(infoSet) - 1
-    curr_player = plays % 2
-    other_player = 1 - curr_player
-
-    curr_node = nodeMap[str(infoSet)]
-    curr_node.times_visited += 1
-    # Return Payoff for terminal nodes.
-    if curr_node.isTerminal():
-        return curr_node.returnPayoff(rolledDice)
-
-    realization_weight = p1 if curr_player == 0 else p0
-    # This gets the current strategy based on regretSum,
-    # also adds the regret sum to the cumulative regretSum
-
-    strategy = curr_node.getStrategy(realization_weight)
-
-    # nodeUtil is the weighted average of the cfr of each branch,
-    # weighted by the probability of traversing down a branch
-    nodeUtil = 0
-
-    NUM_ACTIONS = len(curr_node.regretSum)
-    # This is the cf-utility of each subsequent choice.
-    util = [0] * NUM_ACTIONS
-
-    # For each action, recursively call cfr with additional history and probability
-    for a in curr_node.promising_branches:
-        nextIS = [str(rolledDice[other_player])] + infoSet[1:] + [curr_node.children[a]]
-        # The first probability is player 1's counterfactual probability
-        if curr_player == 0:
-            util[a] = -cfrPruned(rolledDice, nextIS, p0 * strategy[a], p1)
-        # Current player is 1
-        else:
-            util[a] = -cfrPruned(rolledDice, nextIS, p0, p1 * strategy[a])
-        nodeUtil += strategy[a] * util[a]
-
-    # For each action, compute and accumulate counterfactual regret
-    for a in curr_node.promising_branches:
-        regret = util[a] - nodeUtil
-        curr_node.regretSum[a] += (p1 if curr_player == 0 else p0) * regret
-
-    return nodeUtil
-
-def cfrPrunedPar(rolledDice: List[float], infoSet: List[str], p0: float, p1: float, pool, d, m) -> float:
+    If the nodes carry promising_branches (see DudoUtil.prune), a share prunedRatio of the
+    iterations uses cfrPruned as in trainerPruned, the others full cfr.
+    Exactly iterations are trained: the last round spreads what remains of them over the batches,
+    the first ones getting one more, and runs only the batches that get any.
+    rule must be None or 'cfr', see checkRule.
     '''
-    Cfr with pruning paralleled in all iterations.
+    global tree
+    checkRule(rule)
+    if tree is None:
+        tree = DudoArrayTree()
+    numWorkers = numWorkers or cpu_count()
+    numBatches = numBatches or numWorkers
+    NUM_SLOTS = len(tree.regretSum)
+    branches = tree.promisingBranches()
+    evaluator = GameValueEvaluator(tree)
+
+    baseMemory = shared_memory.SharedMemory(create=True, size=2 * NUM_SLOTS * 8)
+    deltaMemory = shared_memory.SharedMemory(create=True, size=numBatches * 2 * NUM_SLOTS * 8)
+    try:
+        base = np.ndarray((2, NUM_SLOTS), dtype=np.float64, buffer=baseMemory.buf)
+        deltas = np.ndarray((numBatches, 2, NUM_SLOTS), dtype=np.float64, buffer=deltaMemory.buf)
+        base[0], base[1] = tree.regretSum, tree.strategySum
+        initargs = (baseMemory.name, deltaMemory.name, NUM_SLOTS, numBatches, branches)
+        # Build the templates once here, forked workers inherit them.
+        treeTemplate()
+        DudoArrayTree.cached()
+        with multiprocessing.Pool(numWorkers, initializer=initWorker, initargs=initargs) as pool:
+            t1 = time.time()
+            done = 0
+            rounds = 0
+            print_freq = 10000
+            while done < iterations:
+                remaining = min(iterations - done, batchSize * numBatches)
+                size, extra = divmod(remaining, numBatches)
+                sizes = [size + 1] * extra + [size] * (numBatches - extra)
+                args = [(batch, f"{seed}-{rounds}-{batch}", sizes[batch], prunedRatio)
+                        for batch in range(numBatches) if sizes[batch]]
+                pool.starmap(runBatch, args)
+                # Deterministic merge: deltas are added in batch order.
+                tree.regretSum += deltas[:len(args), 0].sum(axis=0)
+                tree.strategySum += deltas[:len(args), 1].sum(axis=0)
+                base[0], base[1] = tree.regretSum, tree.strategySum
+
+                previous = done
+                done += remaining
+                rounds += 1
+                # Progress
+                if done // print_freq > previous // print_freq:
+                    print(f"Dudo trained {done} iterations. {str((done - previous) / (time.time() - t1))} iterations per second.")
+                    print("Theoretical game value: " + str(evaluator.gameValue()))
+                t1 = time.time()
+    finally:
+        for memory in (baseMemory, deltaMemory):
+            memory.close()
+            memory.unlink()
 
-    '''
-    plays = len(infoSet) - 1
-    curr_player = plays % 2
-    other_player = 1 - curr_player
-
-    curr_node = d[str(infoSet)]
-    curr_node.times_visited += 1
-    # Return Payoff for terminal nodes.
-    if curr_node.isTerminal():
-        return curr_node.returnPayoff(rolledDice)
-
-    realization_weight = p1 if curr_player == 0 else p0
-    # This gets the current strategy based on regretSum,
-    # also adds the regret sum to the cumulative regretSum
-
-    strategy = curr_node.getStrategy(realization_weight)
-
-    nodeUtil = 0
-    NUM_ACTIONS = len(curr_node.regretSum)
-    # This is the cf-utility of each subsequent choice.
-    util = [0] * NUM_ACTIONS
-
-    # For each action, recursively call cfr with additional history and probability
-    # for a in curr_node.promising_branches:
-    #     nextIS = [str(rolledDice[other_player])] + infoSet[1:] + [curr_node.children[a]]
-    #     nodeUtil_a, util_a = cfrRecursiveWrapper(curr_node, rolledDice, nextIS, p0, p1, strategy[a], nodeUtil)
-    #     nodeUtil += nodeUtil_a
-    #     util[a] = util_a
-
-    args = []
-    d2 = m.dict()
-    for a in curr_node.promising_branches:
-        nextIS = [str(rolledDice[other_player])] + infoSet[1:] + [curr_node.children[a]]
-        args.append([curr_player, rolledDice, nextIS, p0, p1, strategy[a], d, d2, a])
-
-    pool.starmap(cfrRecursiveWrapper, args)
-
-    nodeUtil = sum(d2[a][0] for a in d2)
-    # For each action, compute and accumulate counterfactual regret
-    for a in curr_node.promising_branches:
-        regret = d2[a][1] - nodeUtil
-        curr_node.regretSum[a] += (p1 if curr_player == 0 else p0) * regret
-
-    return nodeUtil
-
-def cfrRecursiveWrapper(curr_player, rolledDice: List[float], nextIS: List[str],
-                        p0: float, p1: float, strategy_a, dict, d2, a):
-    # The first probability is player 1's counterfactual probability
-    if curr_player == 0:
-        util_a = -cfrPrunedrec(rolledDice, nextIS, p0 * strategy_a, p1, dict)
-    # Current player is 1
-    else:
-        util_a = -cfrPrunedrec(rolledDice, nextIS, p0, p1 * strategy_a, dict)
-    nodeUtil_a = strategy_a * util_a
-    d2[a] = [nodeUtil_a, util_a]
-
-
-def cfrPrunedrec(rolledDice: List[float], infoSet: List[str], p0: float, p1: float, d) -> float:
-    '''
-    Cfr with pruning.
 
-    '''
-    plays = len(infoSet) - 1
-    curr_player = plays % 2
-    other_player = 1 - curr_player
+# Worker state, set up once per process by initWorker.
+_base = _deltas = _runner = None
+_memory = []
+
 
-    curr_node = d[str(infoSet)]
-    curr_node.times_visited += 1
-    # Return Payoff for terminal nodes.
-    if curr_node.isTerminal():
-        return curr_node.returnPayoff(rolledDice)
+def initWorker(baseName: str, deltaName: str, NUM_SLOTS: int, numBatches: int, branches: dict):
+    global _base, _deltas, _runner
+    baseMemory = shared_memory.SharedMemory(name=baseName)
+    deltaMemory = shared_memory.SharedMemory(name=deltaName)
+    _memory.extend([baseMemory, deltaMemory])
+    _base = np.ndarray((2, NUM_SLOTS), dtype=np.float64, buffer=baseMemory.buf)
+    _deltas = np.ndarray((numBatches, 2, NUM_SLOTS), dtype=np.float64, buffer=deltaMemory.buf)
+    _runner = BatchRunner(branches)
 
-    realization_weight = p1 if curr_player == 0 else p0
 
-    # This gets the current strategy based on regretSum,
-    # also adds the regret sum to the cumulative regretSum
+def checkRule(rule):
+    '''
+    Rejects update rules other than vanilla cfr, which the batches cannot run.
+    >>> checkRule('dcfr')
+    Traceback (most recent call last):
+    ...
+    Exception: Batches run vanilla cfr only, train 'dcfr' with trainerPruned.
+    '''
+    name = makeRule(rule).name
+    if name != 'cfr':
+        raise Exception(f"Batches run vanilla cfr only, train '{name}' with trainerPruned.")
+
 
-    strategy = curr_node.getStrategy(realization_weight)
+def batchNodeMap(branches: dict):
+    '''
+    The nodeMap a worker runs its batches on, pruned to branches, and the IterativeCfr engine of its full iterations.
+    '''
+    nodeMap = createEmptyTree()
+    for key in branches:
+        nodeMap[key].promising_branches = branches[key]
+    # cfrPruned looks nodes up in its module's nodeMap, and updates with its updateRule (a forked worker
+    # may inherit another one).
+    trainerPruned.nodeMap = nodeMap
+    trainerPruned.updateRule = UpdateRule()
+    return nodeMap, IterativeCfr(nodeList(nodeMap))
 
-    # nodeUtil is the weighted average of the cfr of each branch,
-    # weighted by the probability of traversing down a branch
-    nodeUtil = 0
 
-    NUM_ACTIONS = len(curr_node.regretSum)
-    # This is the cf-utility of each subsequent choice.
-    util = [0] * NUM_ACTIONS
+class BatchRunner():
+    '''
+    Runs batches on one nodeMap (see batchNodeMap) that persists between them.
+    Before a batch, only the nodes whose sums differ from what the nodeMap holds are rewritten. After it,
+    only the nodes of the sampled rolls are gathered: a node is visited only when its player rolled its die.
+    So the nodes copied are the ones the batches traverse, not the whole tree.
+    '''
+
+    def __init__(self, branches: dict):
+        layout = DudoArrayTree.cached()
+        self.nodeMap, self.engine = batchNodeMap(branches)
+        self.pruned = len(branches) > 0
+        self.nodes = [self.nodeMap[key] for key in layout.keys]
+        self.offset = layout.offset.tolist()
+        NUM_ACTIONS = np.repeat(layout.numActions, 6)
+        self.slotNode = np.repeat(np.arange(layout.numNodes), NUM_ACTIONS)
+        # The decision nodes and their slots by player and roll (node index = 6 * public + roll - 1).
+        self.rollNodes = [[None] * 6 for _ in range(2)]
+        self.rollSlots = [[None] * 6 for _ in range(2)]
+        for player in range(2):
+            for roll in range(6):
+                index = 6 * np.flatnonzero((layout.player == player) & (layout.numActions > 0)) + roll
+                self.rollNodes[player][roll] = index.tolist()
+                self.rollSlots[player][roll] = np.concatenate([np.arange(layout.offset[i], layout.offset[i] + NUM_ACTIONS[i])
+                                                               for i in index])
+        # regretSum and strategySum as the nodeMap holds them, in the layout.
+        self.held = np.zeros((2, len(layout.regretSum)))
+
+    def sync(self, regretSum: np.ndarray, strategySum: np.ndarray):
+        '''
+        Rewrites the nodes whose sums differ from regretSum and strategySum.
+        '''
+        changed = np.flatnonzero((self.held[0] != regretSum) | (self.held[1] != strategySum))
+        if len(changed) == 0:
+            return
+        regrets, strategies = regretSum.tolist(), strategySum.tolist()
+        for i in np.unique(self.slotNode[changed]).tolist():
+            node, start = self.nodes[i], self.offset[i]
+            end = start + len(node.regretSum)
+            node.regretSum[:] = regrets[start: end]
+            node.strategySum[:] = strategies[start: end]
+        self.held[0], self.held[1] = regretSum, strategySum
+
+    def run(self, regretSum: np.ndarray, strategySum: np.ndarray, seed: str, batchSize: int,
+            prunedRatio: float) -> tuple:
+        '''
+        Runs batchSize sampled iterations from regretSum and strategySum, a share prunedRatio of them with
+        cfrPruned if the nodes are pruned, and returns the changes of regretSum and strategySum.
+        '''
+        self.sync(regretSum, strategySum)
+        rng = random.Random(seed)
+        rolls = (set(), set())
+        for i in range(batchSize):
+            rr = rng.random()
+            rolledDice = [rng.randint(1, 6), rng.randint(1, 6)]
+            rolls[0].add(rolledDice[0] - 1)
+            rolls[1].add(rolledDice[1] - 1)
+            if self.pruned and rr < prunedRatio:
+                trainerPruned.cfrPruned(rolledDice, [str(rolledDice[0])], 1, 1)
+            else:
+                self.engine.run(rolledDice)
+        for player in range(2):
+            for roll in rolls[player]:
+                nodes = [self.nodes[i] for i in self.rollNodes[player][roll]]
+                slots = self.rollSlots[player][roll]
+                self.held[0, slots] = np.fromiter(chain.from_iterable(node.regretSum for node in nodes), dtype=np.float64,
+                                                  count=len(slots))
+                self.held[1, slots] = np.fromiter(chain.from_iterable(node.strategySum for node in nodes), dtype=np.float64,
+                                                  count=len(slots))
+        return self.held[0] - regretSum, self.held[1] - strategySum
 
-    # For each action, recursively call cfr with additional history and probability
-    for a in curr_node.promising_branches:
-        nextIS = [str(rolledDice[other_player])] + infoSet[1:] + [curr_node.children[a]]
-        # The first probability is player 1's counterfactual probability
-        if curr_player == 0:
-            util[a] = -cfrPrunedrec(rolledDice, nextIS, p0 * strategy[a], p1, d)
-        # Current player is 1
-        else:
-            util[a] = -cfrPrunedrec(rolledDice, nextIS, p0, p1 * strategy[a], d)
-        nodeUtil += strategy[a] * util[a]
 
-    # For each action, compute and accumulate counterfactual regret
-    for a in curr_node.promising_branches:
-        regret = util[a] - nodeUtil
-        curr_node.regretSum[a] += (p1 if curr_player == 0 else p0) * regret
+def runBatch(batch: int, seed: str, batchSize: int, prunedRatio: float):
+    _deltas[batch, 0], _deltas[batch, 1] = _runner.run(_base[0], _base[1], seed, batchSize, prunedRatio)
 
-    return nodeUtil
 
 if __name__ == '__main__':
     start_time = time.time()
     cwd = getcwd()
-    continueTrain(cwd + '/trainedTrees/Discounted/dt-500kDcPruned', 100, cwd + '/trainedTrees/Discounted/dt-1MCons1')
-    print("--- %s seconds ---" % (time.time() - start_time))
\ No newline at end of file
+    continueTrain(cwd + '/trainedTrees/Discounted/dt-500kDcPruned', 100000, cwd + '/trainedTrees/Discounted/dt-1MCons1')
+    print("--- %s seconds ---" % (time.time() - start_time))
@@ -0,0 +1,207 @@
+'''
+Monte Carlo CFR. Like DudoTrainer.cfr, both sample the dice, but they also sample actions:
+external sampling (cfrExternal) enumerates the actions of the traversing player and samples
+one action of the opponent, outcome sampling (cfrOutcome) samples a single path to a terminal
+and corrects the regrets with importance weights. Each iteration traverses once for each player.
+Both train the same nodeMap of DudoNode as DudoTrainer and write the same checkpoints, so runs
+can be continued by either trainer. Values are returned as utilities of the traversing player.
+'''
+from typing import List, Tuple
+import random, pickle
+from os import getcwd
+import time
+from DudoUtil import createEmptyTree, readNodeMap
+import DudoCheckpoint
+from DudoEvaluator import evaluatorFor
+from DudoRules import DudoRules, LazyNodeMap, ONE_DIE
+from DudoUpdateRule import UpdateRule, makeRule
+from DudoTelemetry import Telemetry
+
+nodeMap = None
+# Total iterations trained on nodeMap, as far as known. Recorded in checkpoints.
+iteration = 0
+# Strategy and regret updates, see DudoUpdateRule.
+updateRule = UpdateRule()
+# Share of uniform exploration in the traverser's sampling policy of outcome sampling.
+exploration = .6
+
+
+def continueTrain(file, iterations: int, savePath, sampling: str = 'external',
+                  checkpointPath: str = None, checkpointEvery: int = None, evalInBackground: bool = False,
+                  withExploitability: bool = False, rule=None, telemetryPath: str = None, profile: bool = False,
+                  rules: DudoRules = None):
+    '''
+    file is a pickled nodeMap or a DudoCheckpoint (of any trainer), in which case the iteration count,
+    the random state and, unless rule is given, the update rule are restored as well.
+    '''
+    global nodeMap, iteration
+    if DudoCheckpoint.isCheckpoint(file):
+        nodeMap, metadata = DudoCheckpoint.loadNodeMap(file)
+        iteration = metadata['iteration'] or 0
+        if metadata['rng'] is not None:
+            DudoCheckpoint.restoreRandom(metadata)
+        if rule is None:
+            rule = metadata.get('rule')
+    else:
+        nodeMap = readNodeMap(file)
+    train(iterations, savePath, sampling, checkpointPath, checkpointEvery, evalInBackground, withExploitability, rule,
+          telemetryPath, profile, rules)
+
+
+def train(iterations: int, savePath, sampling: str = 'external',
+          checkpointPath: str = None, checkpointEvery: int = None, evalInBackground: bool = False,
+          withExploitability: bool = False, rule=None, telemetryPath: str = None, profile: bool = False,
+          rules: DudoRules = None):
+    '''
+    sampling is 'external' or 'outcome'. The other arguments are as in DudoTrainer.train.
+    With rules, the nodes of a variant are created as the samples reach them (see DudoRules.LazyNodeMap),
+    which is what makes multi-dice variants trainable. A loaded nodeMap must have these rules.
+    '''
+    global nodeMap, iteration, updateRule
+    if rule is not None:
+        updateRule = makeRule(rule)
+    if rules is not None and nodeMap is None:
+        nodeMap = LazyNodeMap(rules)
+    elif rules is not None and getattr(nodeMap, 'rules', ONE_DIE) != rules:
+        raise Exception(f'nodeMap holds {getattr(nodeMap, "rules", ONE_DIE).describe()}, not {rules.describe()}.')
+    if nodeMap is None:
+        nodeMap = createEmptyTree()
+    rules = getattr(nodeMap, 'rules', None)
+    if rules not in (None, ONE_DIE) and checkpointPath:
+        raise Exception('Checkpoints hold the one-die game only, pickle the nodeMap of other variants.')
+    evaluator = evaluatorFor(nodeMap, withExploitability)
+    telemetry = Telemetry(telemetryPath, nodeMap, sampling + ' mccfr', profile, iteration)
+    log = []
+    t1 = time.time()
+    print_freq = 10000
+    for i in range(1, iterations):
+        updateRule.startIteration(iteration + 1)
+        for traverser in (0, 1):
+            # Sample an outcome of roll. First one is self rolled, second is opponent.
+            rolledDice = rules.sampleRolls() if rules else [random.randint(1, 6), random.randint(1, 6)]
+            if sampling == 'outcome':
+                cfrOutcome(rolledDice, [str(rolledDice[0])], traverser, 1, 1)
+            else:
+                cfrExternal(rolledDice, [str(rolledDice[0])], traverser)
+        iteration += 1
+        if checkpointEvery and i % checkpointEvery == 0:
+            with telemetry.section('io'):
+                saveCheckpoint(checkpointPath, sampling)
+
+        # Progress
+        if i % print_freq == 0:
+            print(f"Dudo trained {i} iterations. {str(print_freq / (time.time() - t1))} iterations per second.")
+            log.append(f"Dudo trained {i} iterations. {str(print_freq / (time.time() - t1))} iterations per second.")
+            with telemetry.section('evaluation'):
+                lines = evaluator.report(i, evalInBackground)
+            for line in lines:
+                print(line)
+                log.append(line)
+            telemetry.record(iteration, evaluator)
+            t1 = time.time()
+
+    for line in evaluator.collect(wait=True):
+        print(line)
+        log.append(line)
+    evaluator.close()
+
+    # Save the trained algorithm
+    updateRule.flush(nodeMap.values())
+    if checkpointPath:
+        saveCheckpoint(checkpointPath, sampling)
+    with open(savePath, 'wb') as f:
+        pickle.dump(nodeMap, f)
+    return log
+
+
+def saveCheckpoint(path: str, sampling: str):
+    updateRule.flush(nodeMap.values())
+    DudoCheckpoint.save(path, nodeMap, DudoCheckpoint.trainingState(iteration, sampling + ' mccfr',
+                                                                   rule=updateRule.describe()))
+
+
+def terminalUtil(node, rolledDice: List[int], infoSet: List[str], traverser: int) -> float:
+    # returnPayoff is the payoff of the player to act at the terminal node.
+    payoff = node.returnPayoff(rolledDice)
+    return payoff if (len(infoSet) - 1) % 2 == traverser else -payoff
+
+
+def cfrExternal(rolledDice: List[int], infoSet: List[str], traverser: int) -> float:
+    '''
+    External sampling: returns the sampled counterfactual value of the traverser.
+    The traverser's regrets are updated at its nodes, the opponent's strategy sums at the opponent's nodes.
+    '''
+    plays = len(infoSet) - 1
+    curr_player = plays % 2
+    other_player = 1 - curr_player
+
+    curr_node = nodeMap[str(infoSet)]
+    curr_node.times_visited += 1
+    if curr_node.isTerminal():
+        return terminalUtil(curr_node, rolledDice, infoSet, traverser)
+
+    NUM_ACTIONS = len(curr_node.children)
+    nextRoll = [str(rolledDice[other_player])]
+    if curr_player != traverser:
+        # The opponent's own reach is accounted for by sampling its actions.
+        strategy = updateRule.getStrategy(curr_node, 1)
+        a = random.choices(range(NUM_ACTIONS), weights=strategy)[0]
+        return cfrExternal(rolledDice, nextRoll + infoSet[1:] + [curr_node.children[a]], traverser)
+
+    strategy = updateRule.getStrategy(curr_node, 0)
+    util = [0] * NUM_ACTIONS
+    nodeUtil = 0
+    for a in range(NUM_ACTIONS):
+        util[a] = cfrExternal(rolledDice, nextRoll + infoSet[1:] + [curr_node.children[a]], traverser)
+        nodeUtil += strategy[a] * util[a]
+    updateRule.accumulateRegret(curr_node, util, nodeUtil, 1, range(NUM_ACTIONS))
+    return nodeUtil
+
+
+def cfrOutcome(rolledDice: List[int], infoSet: List[str], traverser: int,
+               reachOpponent: float, sample: float) -> Tuple[float, float]:
+    '''
+    Outcome sampling: returns (utility of the traverser / probability of the sampled terminal,
+    probability that the traverser's strategy plays from here to the sampled terminal).
+    The traverser samples from its strategy mixed with exploration, the opponent from its strategy.
+    sample is the probability of sampling the path so far.
+    '''
+    plays = len(infoSet) - 1
+    curr_player = plays % 2
+    other_player = 1 - curr_player
+
+    curr_node = nodeMap[str(infoSet)]
+    curr_node.times_visited += 1
+    if curr_node.isTerminal():
+        return terminalUtil(curr_node, rolledDice, infoSet, traverser) / sample, 1
+
+    NUM_ACTIONS = len(curr_node.children)
+    nextRoll = [str(rolledDice[other_player])]
+    if curr_player != traverser:
+        # Stochastically weighted averaging: own reach over the probability of the sample.
+        strategy = updateRule.getStrategy(curr_node, reachOpponent / sample)
+        a = random.choices(range(NUM_ACTIONS), weights=strategy)[0]
+        util, tail = cfrOutcome(rolledDice, nextRoll + infoSet[1:] + [curr_node.children[a]], traverser,
+                                reachOpponent * strategy[a], sample * strategy[a])
+        return util, tail * strategy[a]
+
+    strategy = updateRule.getStrategy(curr_node, 0)
+    if random.random() < exploration:
+        a = random.randrange(NUM_ACTIONS)
+    else:
+        a = random.choices(range(NUM_ACTIONS), weights=strategy)[0]
+    sampled = exploration / NUM_ACTIONS + (1 - exploration) * strategy[a]
+    util, tail = cfrOutcome(rolledDice, nextRoll + infoSet[1:] + [curr_node.children[a]], traverser,
+                            reachOpponent, sample * sampled)
+    # The sampled action has value util * tail, the others are taken as zero: regret[b] = value * (1[a == b] - strategy[a]).
+    actionUtil = [0] * NUM_ACTIONS
+    actionUtil[a] = reachOpponent * util * tail
+    updateRule.accumulateRegret(curr_node, actionUtil, strategy[a] * actionUtil[a], 1, range(NUM_ACTIONS))
+    return util, tail * strategy[a]
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    cwd = getcwd()
+    train(10 ** 6, cwd + '/trainedTrees/dt-1MExternal', 'external')
+    print("--- %s seconds ---" % (time.time() - start_time))
@@ -0,0 +1,119 @@
+import pickle
+from os import getcwd
+import time
+import numpy as np
+from DudoArrayTree import DudoArrayTree
+from DudoPayoff import PAYOFF_TABLE, claimStrength
+from DudoUtil import readNodeMap
+from DudoEvaluator import GameValueEvaluator
+
+tree = None
+
+
+def continueTrain(file, iterations: int, savePath):
+    global tree
+    tree = DudoArrayTree.fromNodeMap(readNodeMap(file))
+    train(iterations, savePath)
+
+
+def train(iterations: int, savePath, chance: np.ndarray = None):
+    '''
+    Full-width chance CFR: every iteration walks the public tree once for all 36 dice outcomes.
+    chance[d0 - 1][d1 - 1] weights each outcome; the default 1/36 makes one iteration the
+    expected update of one chance-sampled iteration of DudoTrainer.train.
+    '''
+    global tree
+    if tree is None:
+        tree = DudoArrayTree()
+    if chance is None:
+        chance = np.full((6, 6), 1 / 36)
+    prepareTerminals(tree)
+    evaluator = GameValueEvaluator(tree)
+    t1 = time.time()
+    util = 0
+    print_freq = 100
+    for i in range(1, iterations):
+        util += cfrVector(tree, 0, np.ones(6), np.ones(6), chance)
+
+        # Progress
+        if i % print_freq == 0:
+            elapsed = time.time() - t1
+            print(f"Dudo trained {i} iterations. {str(print_freq / elapsed)} iterations per second, "
+                  f"{str(36 * print_freq / elapsed)} outcomes per second.")
+            print("Theoretical game value: " + str(evaluator.gameValue()))
+            t1 = time.time()
+
+    with open(savePath, 'wb') as f:
+        pickle.dump(tree.toNodeMap(), f)
+
+
+def prepareTerminals(tree: DudoArrayTree):
+    '''
+    Stores the payoff matrix of every terminal public history on the tree, as seen by its claimant.
+    '''
+    if hasattr(tree, 'terminalUtil'):
+        return
+    tree.terminalUtil = [None] * tree.numPublic
+    for public, history in enumerate(tree.history):
+        if history and history[-1] == 'd':
+            tree.terminalUtil[public] = PAYOFF_TABLE[claimStrength(history[-2])].astype(np.float64)
+
+
+def cfrVector(tree: DudoArrayTree, public: int, reach0: np.ndarray, reach1: np.ndarray, chance: np.ndarray) -> float:
+    '''
+    Same update as DudoTrainer.cfr, for all dice outcomes at once.
+    reach0[d - 1] is player 0's probability of playing to this history when rolling d, reach1 likewise.
+    Returns the chance-weighted utility of the player to act.
+    '''
+    return float((chance * _cfrVector(tree, public, reach0, reach1, chance)).sum())
+
+
+def _cfrVector(tree: DudoArrayTree, public: int, reach0: np.ndarray, reach1: np.ndarray, chance: np.ndarray) -> np.ndarray:
+    # Returns the (6, 6) utility matrix of the player to act, indexed by (die of player 0, die of player 1).
+    terminal = tree.terminalUtil[public]
+    if terminal is not None:
+        return terminal
+
+    # weight0[d0][d1] is the realization weight of player 0's regrets, weight1 that of player 1's.
+    # The strategy sums are weighted by the player's own reach instead.
+    weight0 = chance * reach1[None, :]
+    weight1 = chance * reach0[:, None]
+    if not weight0.any() and not weight1.any():
+        # Nothing below this history can be updated, and it contributes nothing above.
+        return np.zeros((6, 6))
+
+    curr_player = tree.player[public]
+    regretSum = tree.block(tree.regretSum, public)
+    strategySum = tree.block(tree.strategySum, public)
+    strategy = tree.block(tree.strategy, public)
+    NUM_ACTIONS = strategy.shape[1]
+
+    # Regret matching for the six rolls of the player to act.
+    np.maximum(regretSum, 0, out=strategy)
+    normalizingSum = strategy.sum(axis=1, keepdims=True)
+    np.divide(strategy, normalizingSum, out=strategy, where=normalizingSum > 0)
+    strategy[normalizingSum[:, 0] <= 0] = 1 / NUM_ACTIONS
+
+    util = np.empty((NUM_ACTIONS, 6, 6))
+    for a, child in enumerate(tree.children(public)):
+        if curr_player == 0:
+            util[a] = -_cfrVector(tree, child, reach0 * strategy[:, a], reach1, chance)
+        else:
+            util[a] = -_cfrVector(tree, child, reach0, reach1 * strategy[:, a], chance)
+
+    if curr_player == 0:
+        nodeUtil = np.einsum('aij,ia->ij', util, strategy)
+        regretSum += np.einsum('aij,ij->ia', util - nodeUtil, weight0)
+        strategySum += strategy * (reach0 * chance.sum(axis=1))[:, None]
+    else:
+        nodeUtil = np.einsum('aij,ja->ij', util, strategy)
+        regretSum += np.einsum('aij,ij->ja', util - nodeUtil, weight1)
+        strategySum += strategy * (reach1 * chance.sum(axis=0))[:, None]
+    return nodeUtil
+
+
+if __name__ == '__main__':
+    start_time = time.time()
+    cwd = getcwd()
+    continueTrain(cwd + '/trainedTrees/Discounted/dt-2MDc', 10000, cwd + '/trainedTrees/Discounted/dt-2MDcVec')
+    print("--- %s seconds ---" % (time.time() - start_time))